@@ -1,26 +1,50 @@
+import asyncio
 import logging
-import shutil
 import re
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
+from typing import Annotated, Callable, Dict, List
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+import msgspec
+from cachetools import TTLCache
+from fastapi import BackgroundTasks, FastAPI, File, Request, Response, UploadFile, HTTPException
 
-from src.config import API_HOST, API_PORT, DEBUG, RAW_DATA_DIR
-from src.rag.generator import RAGGenerator
+from src.config import (
+    API_HOST,
+    API_PORT,
+    API_WORKERS,
+    DEBUG,
+    RAW_DATA_DIR,
+    ANSWER_CACHE_MAX_SIZE,
+    ANSWER_CACHE_TTL_SECONDS,
+    VECTORSTORE_PRELOAD,
+)
+from src.rag.generator import RAGGenerator, clear_retrieval_caches
+from src.rag.vectorstore import preload_vectorstore, vectorstore_loaded
 from src.ingestion.ingest import ingest_file, ingest_directory
+from src.ingestion.loaders import new_hasher
 
 logger = logging.getLogger(__name__)
 
 # ------------------------------------------------------------------------------
 # FastAPI app
 # ------------------------------------------------------------------------------
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Tira a carga do vectorstore/modelo de embeddings da primeira pergunta
+    if VECTORSTORE_PRELOAD:
+        preload_vectorstore()
+    yield
+
 app = FastAPI(
     title="Chatbot Suporte P&S",
     description="API de um chatbot baseado em RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=_lifespan,
 )
 
 # ------------------------------------------------------------------------------
@@ -39,26 +63,189 @@ def _get_rag():
     return _rag
 
 # ------------------------------------------------------------------------------
-# Pydantic models
+# Cache de respostas: perguntas repetidas pulam retrieval e LLM
 # ------------------------------------------------------------------------------
-class AskRequest(BaseModel):
+_answer_cache = TTLCache(maxsize=ANSWER_CACHE_MAX_SIZE, ttl=ANSWER_CACHE_TTL_SECONDS)
+_answer_cache_lock = threading.RLock()
+
+def _cached_answer(endpoint: str, request: "AskRequest", compute: Callable[[], dict]) -> dict:
+    """
+    Retorna a resposta em cache para (endpoint, pergunta normalizada, k,
+    min_score) ou calcula com `compute`. Só respostas sem erro e geradas pelo
+    LLM são guardadas: o fallback (LLM indisponível) é recalculado na próxima
+    pergunta.
+    """
+    key = _answer_key(endpoint, request.question, request.k, request.min_score)
+    with _answer_cache_lock:
+        cached = _answer_cache.get(key)
+    if cached is not None:
+        return cached
+    result = compute()
+    if _cacheable(result):
+        with _answer_cache_lock:
+            _answer_cache[key] = result
+    return result
+
+def _cached_answers(
+    endpoint: str, request: "AskBatchRequest", compute: Callable[[List[str]], List[dict]]
+) -> List[dict]:
+    """
+    Versão em lote de _cached_answer: só as perguntas fora do cache vão para
+    `compute`, numa única chamada.
+    """
+    keys = [_answer_key(endpoint, q, request.k, request.min_score) for q in request.questions]
+    with _answer_cache_lock:
+        results = [_answer_cache.get(key) for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        computed = compute([request.questions[i] for i in misses])
+        with _answer_cache_lock:
+            for i, result in zip(misses, computed):
+                results[i] = result
+                if _cacheable(result):
+                    _answer_cache[keys[i]] = result
+    return results
+
+def _answer_key(endpoint: str, question: str, k: int, min_score: float) -> tuple:
+    return (endpoint, question.strip().lower(), k, round(min_score, 3))
+
+def _cacheable(result: dict) -> bool:
+    return result.get("status") != "error" and not result.get("llm_fallback")
+
+def _invalidate_caches():
+    """Descarta respostas e hits em cache após mudanças no índice."""
+    with _answer_cache_lock:
+        _answer_cache.clear()
+    clear_retrieval_caches()
+
+# ------------------------------------------------------------------------------
+# Jobs de ingestão em background
+# ------------------------------------------------------------------------------
+_MAX_JOBS = 100
+_jobs: Dict[str, Dict] = {}
+
+def _new_job(kind: str) -> Dict:
+    """
+    Registra um job de ingestão e descarta os concluídos mais antigos além de
+    _MAX_JOBS; jobs na fila ou em execução nunca são descartados.
+    """
+    job_id = uuid.uuid4().hex
+    job = _jobs[job_id] = {
+        "job_id": job_id,
+        "type": kind,
+        "status": "queued",
+        "created_at": datetime.now().isoformat(),
+    }
+    excess = len(_jobs) - _MAX_JOBS
+    if excess > 0:
+        finished = [jid for jid, j in _jobs.items() if "finished_at" in j][:excess]
+        for jid in finished:
+            del _jobs[jid]
+    return job
+
+def _run_ingest(root: str, job: Dict, force: bool = False):
+    """
+    Executa ingest_directory fora do request e grava o resultado no job
+    (recebe o próprio dict: o job é atualizado mesmo se sair de _jobs).
+    """
+    job["status"] = "running"
+    try:
+        job["stats"] = ingest_directory(root, force=force)
+        _invalidate_caches()
+        job["status"] = "success"
+    except Exception as e:
+        logger.error(f"Erro no job de ingestão {job['job_id']}: {e}")
+        job["status"] = "error"
+        job["error"] = str(e)
+    job["finished_at"] = datetime.now().isoformat()
+
+def _run_ingest_file(path: str, checksum: str, job: Dict):
+    """Executa ingest_file fora do request e grava o resultado no job."""
+    job["status"] = "running"
+    try:
+        ok = ingest_file(path, root=str(RAW_DATA_DIR), checksum=checksum)
+        _invalidate_caches()
+        if ok:
+            job["status"] = "success"
+            job["message"] = "Arquivo ingerido com sucesso."
+        else:
+            job["status"] = "warning"
+            job["message"] = "Arquivo salvo, mas não foi ingerido (verifique padrão de pasta/nome)."
+    except Exception as e:
+        logger.error(f"Falha ao ingerir arquivo '{path}': {e}")
+        job["status"] = "error"
+        job["error"] = str(e)
+    job["finished_at"] = datetime.now().isoformat()
+
+# ------------------------------------------------------------------------------
+# Request models (msgspec: decodificação/validação em C nos endpoints quentes)
+# ------------------------------------------------------------------------------
+class AskRequest(msgspec.Struct):
     question: str
     k: int = 5
     min_score: float = 0.0
 
+# Limite de perguntas por chamada em /ask-batch
+_ASK_BATCH_MAX_SIZE = 32
+
+class AskBatchRequest(msgspec.Struct):
+    questions: Annotated[List[str], msgspec.Meta(min_length=1, max_length=_ASK_BATCH_MAX_SIZE)]
+    k: int = 5
+    min_score: float = 0.0
+
+_ask_decoder = msgspec.json.Decoder(AskRequest)
+_ask_batch_decoder = msgspec.json.Decoder(AskBatchRequest)
+_json_encoder = msgspec.json.Encoder()
+
+# Schema do corpo para o OpenAPI, já que o FastAPI não lê o corpo nesses endpoints
+_, _SCHEMAS = msgspec.json.schema_components([AskRequest, AskBatchRequest])
+
+def _openapi_body(name: str) -> dict:
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _SCHEMAS[name]}},
+        }
+    }
+
+_ASK_OPENAPI = _openapi_body("AskRequest")
+_ASK_BATCH_OPENAPI = _openapi_body("AskBatchRequest")
+
+async def _decode_ask(http_request: Request, decoder: msgspec.json.Decoder = _ask_decoder):
+    """Decodifica o corpo JSON no modelo do decoder; erros de formato viram 422."""
+    try:
+        return decoder.decode(await http_request.body())
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _json_response(content: dict) -> Response:
+    return Response(content=_json_encoder.encode(content), media_type="application/json")
+
 # ------------------------------------------------------------------------------
 # Helpers de upload -> alinhar com parse_path_metadata
 # ------------------------------------------------------------------------------
-_SANITIZE_RE = re.compile(r"[^a-z0-9\-]+")
+_SANITIZE_RE = re.compile(r"[^a-z0-9]+")
+
+# Tamanho do bloco de cópia do upload (1 MiB)
+_UPLOAD_BLOCK_SIZE = 1 << 20
+
+# Sufixo de versão do mês corrente, recalculado no máximo a cada minuto
+_VERSION_TTL_SECONDS = 60.0
+_version_cache = {"value": "", "expires": 0.0}
 
 def _sanitize_title(name: str) -> str:
     """
     Normaliza o título para o padrão de arquivo: minúsculo, hífens, sem acentos/esp. 
     Ex.: "Recebimento de Material" -> "recebimento-de-material"
     """
-    n = name.lower().strip().replace(" ", "-")
-    n = _SANITIZE_RE.sub("-", n)
-    return re.sub(r"-{2,}", "-", n).strip("-")
+    return _SANITIZE_RE.sub("-", name.lower().strip()).strip("-")
+
+def _current_version() -> str:
+    now = time.monotonic()
+    if now >= _version_cache["expires"]:
+        _version_cache["value"] = datetime.now().strftime("v%Y-%m")
+        _version_cache["expires"] = now + _VERSION_TTL_SECONDS
+    return _version_cache["value"]
 
 def _ensure_version(name: str) -> str:
     """
@@ -67,8 +254,7 @@ def _ensure_version(name: str) -> str:
     """
     if "__v" in name:
         return name
-    v = datetime.now().strftime("v%Y-%m")
-    return f"{name}__{v}"
+    return f"{name}__{_current_version()}"
 
 # ------------------------------------------------------------------------------
 # Endpoints
@@ -79,48 +265,71 @@ async def health():
     return {
         "status": "healthy",
         "service": "Chatbot Suporte P&S",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "vectorstore": "ready" if vectorstore_loaded() else "loading",
     }
 
-@app.post("/ask")
-async def ask(request: AskRequest):
+@app.post("/ask", openapi_extra=_ASK_OPENAPI)
+async def ask(http_request: Request):
     """
     Faz uma pergunta ao RAG. Se o LLM estiver indisponível, retorna fallback
     com trechos relevantes.
     """
+    request = await _decode_ask(http_request)
     try:
-        result = _get_rag().generate(
+        result = await asyncio.to_thread(_cached_answer, "ask", request, lambda: _get_rag().generate(
             query=request.question,
             k=request.k,
             min_score=request.min_score
-        )
-        return JSONResponse(content=result)
+        ))
+        return _json_response(result)
     except Exception as e:
         logger.error(f"Erro no endpoint /ask: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/ask-with-sources")
-async def ask_with_sources(request: AskRequest):
+@app.post("/ask-with-sources", openapi_extra=_ASK_OPENAPI)
+async def ask_with_sources(http_request: Request):
     """
     Faz uma pergunta e retorna também as fontes (caminhos dos arquivos).
     """
+    request = await _decode_ask(http_request)
     try:
-        result = _get_rag().generate_with_sources(
-            query=request.question,
-            k=request.k
+        result = await asyncio.to_thread(
+            _cached_answer, "ask-with-sources", request, lambda: _get_rag().generate_with_sources(
+                query=request.question,
+                k=request.k
+            )
         )
-        return JSONResponse(content=result)
+        return _json_response(result)
     except Exception as e:
         logger.error(f"Erro no endpoint /ask-with-sources: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ask-batch", openapi_extra=_ASK_BATCH_OPENAPI)
+async def ask_batch(http_request: Request):
+    """
+    Faz várias perguntas numa chamada (vários usuários, avaliação): o
+    retrieval das que não estão em cache sai de uma única busca em lote.
+    """
+    request = await _decode_ask(http_request, _ask_batch_decoder)
+    try:
+        results = await asyncio.to_thread(_cached_answers, "ask", request, lambda questions: _get_rag().generate_batch(
+            questions,
+            k=request.k,
+            min_score=request.min_score
+        ))
+        return _json_response({"results": results})
+    except Exception as e:
+        logger.error(f"Erro no endpoint /ask-batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Upload de documento compatível com o parser de ingestão.
     - Salva em data/raw/sistemas/_sandbox/
     - Normaliza o nome para titulo__vYYYY-MM.ext
-    - Ingestão incremental do arquivo salvo
+    - Agenda a ingestão incremental do arquivo salvo (acompanhe em /ingest-status)
     """
     allowed = {".pdf", ".docx", ".txt"}
     ext = Path(file.filename).suffix.lower()
@@ -141,57 +350,63 @@ async def upload_document(file: UploadFile = File(...)):
     titlev = _ensure_version(title)
     dst = sandbox / f"{titlev}{ext}"
 
-    # Grava o arquivo
+    # Grava o arquivo em blocos de 1 MiB, calculando o checksum no caminho
+    algo, h = new_hasher()
     try:
         with open(dst, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+            while True:
+                block = file.file.read(_UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+                f.write(block)
     except Exception as e:
         logger.error(f"Falha ao gravar arquivo: {e}")
         raise HTTPException(status_code=500, detail="Falha ao salvar arquivo")
 
-    # Ingestão incremental do arquivo salvo
-    try:
-        ok = ingest_file(str(dst), root=str(RAW_DATA_DIR))
-    except Exception as e:
-        logger.error(f"Falha ao ingerir arquivo '{dst}': {e}")
-        raise HTTPException(status_code=500, detail=f"Falha na ingestão: {e}")
-
-    if not ok:
-        return {
-            "status": "warning",
-            "message": "Arquivo salvo, mas não foi ingerido (verifique padrão de pasta/nome).",
-            "path": str(dst)
-        }
+    # Ingestão incremental do arquivo salvo, em background
+    job = _new_job("upload")
+    background_tasks.add_task(_run_ingest_file, str(dst), f"{algo}:{h.hexdigest()}", job)
 
     return {
-        "status": "success",
-        "message": "Arquivo salvo e ingerido com sucesso.",
-        "path": str(dst)
+        "status": "accepted",
+        "message": "Arquivo salvo; ingestão agendada.",
+        "path": str(dst),
+        "job_id": job["job_id"]
     }
 
 @app.post("/ingest-batch")
-async def ingest_batch():
+async def ingest_batch(background_tasks: BackgroundTasks, force: bool = False):
     """
     Ingestão em lote: percorre data/raw, descobre, extrai, chunka e indexa.
+    Roda em background; acompanhe o resultado em /ingest-status/{job_id}.
+    `force=true` reindexa tudo (ex.: após trocar CHUNK_SIZE ou o modelo).
     """
-    try:
-        stats = ingest_directory(str(RAW_DATA_DIR))
-        return {
-            "status": "success",
-            "stats": stats
-        }
-    except Exception as e:
-        logger.error(f"Erro no endpoint /ingest-batch: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    job = _new_job("batch")
+    background_tasks.add_task(_run_ingest, str(RAW_DATA_DIR), job, force)
+    return {
+        "status": "accepted",
+        "job_id": job["job_id"]
+    }
+
+@app.get("/ingest-status/{job_id}")
+async def ingest_status(job_id: str):
+    """Status de um job de ingestão (queued | running | success | warning | error)."""
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
 
 # ------------------------------------------------------------------------------
 # Exec local
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
     import uvicorn
+    # reload/workers exigem o app como import string; em DEBUG roda 1 worker com reload
     uvicorn.run(
-        app,
+        "src.api.main:app",
         host=API_HOST,
         port=API_PORT,
-        reload=DEBUG
+        reload=DEBUG,
+        workers=1 if DEBUG else API_WORKERS
     )
\ No newline at end of file
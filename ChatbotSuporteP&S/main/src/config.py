@@ -30,6 +30,24 @@ CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
 # Diretório de persistência local do vectorstore
 CHROMA_PERSIST_DIR = BASE_DIR / "data" / "chroma"
 
+# Backend do vectorstore (simple | faiss)
+VECTORSTORE = os.getenv("VECTORSTORE", "simple").lower()
+# Carrega vectorstore e modelo de embeddings numa thread ao subir a API, em
+# vez de na primeira pergunta
+VECTORSTORE_PRELOAD = os.getenv("VECTORSTORE_PRELOAD", "true").lower() in {"1", "true", "yes", "y"}
+
+# Faiss: índice usado após FAISS_TRAIN_SIZE vetores (antes disso a busca é exata)
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "IVF4096,PQ32")
+FAISS_TRAIN_SIZE = int(os.getenv("FAISS_TRAIN_SIZE", "160000"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# Cache de similaridade de consultas (QVCache) usado por /ask e /ask-with-sources
+# QVCACHE_THRESHOLD é a distância de cosseno máxima para considerar um acerto.
+QVCACHE_MAX_SIZE = int(os.getenv("QVCACHE_MAX_SIZE", "256"))
+QVCACHE_TTL_SECONDS = float(os.getenv("QVCACHE_TTL_SECONDS", "600"))
+QVCACHE_THRESHOLD = float(os.getenv("QVCACHE_THRESHOLD", "0.05"))
+
 # Provedores (azure | openai | huggingface)
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "azure").lower()
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "azure").lower()
@@ -45,13 +63,50 @@ AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
 
-# HuggingFace local (fallback/compatibilidade)
+# Precisão dos embeddings do corpus no vectorstore (float32 | int8 | binary)
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32").lower()
+
+# Cache persistente de embeddings dos chunks (vazio desativa)
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", str(BASE_DIR / "data" / "embed_cache.db"))
+
+# Algoritmo do checksum usado como doc_id (blake3 | sha256). Stores com ids
+# "sha256:" são reindexados uma vez: os chunks antigos saem pelo source_path.
+# Sem o pacote blake3 instalado, cai para sha256.
+CHECKSUM_ALGO = os.getenv("CHECKSUM_ALGO", "blake3").lower()
+
+# Extração de PDF: pdfium (pypdfium2, em C) ou pypdf (PyPDFLoader)
+PDF_LOADER = os.getenv("PDF_LOADER", "pdfium").lower()
+
+# Cache em disco dos documentos extraídos (PDF/DOCX/TXT), por doc_id (vazio desativa)
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", str(BASE_DIR / ".cache" / "extract"))
+# Tamanho máximo do cache de extração; acima disso saem os menos usados
+EXTRACT_CACHE_MAX_MB = int(os.getenv("EXTRACT_CACHE_MAX_MB", "1024"))
+
+# HuggingFace local (fallback/compatibilidade). O padrão é multilíngue porque
+# os manuais são em português; para corpus em inglês/misto,
+# sentence-transformers/all-MiniLM-L6-v2 (também 384 dim) tem metade das
+# camadas e codifica ~2x mais rápido. Trocar o modelo exige reindexar.
 EMBEDDING_MODEL = os.getenv(
     "EMBEDDING_MODEL",
     "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
 )
+# Dispositivo/precisão do SentenceTransformer: auto usa CUDA se disponível
+# (float16, lotes de 256) e cai para CPU (float32, lotes de 64). bfloat16
+# usa torch.autocast (GPU ou CPU com suporte a BF16).
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "auto").lower()
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "auto").lower()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "0"))  # 0 = automático
+
+# Cache de respostas de /ask e /ask-with-sources (pergunta, k, min_score)
+ANSWER_CACHE_MAX_SIZE = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
 
 # Configurações da API
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
+# Workers do uvicorn fora de DEBUG. O vectorstore, os caches e o status dos
+# jobs de ingestão ficam em memória, por processo: com mais de um worker, um
+# persist sobrescreve o de outro e /ingest-status pode cair no worker errado.
+# Por isso o padrão é 1.
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
 DEBUG = os.getenv("DEBUG", "False").lower() in {"1", "true", "yes", "y"}
@@ -1,57 +1,215 @@
-from typing import List, Tuple, Dict
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from pathlib import Path
+from typing import Iterable, Dict, List, Optional
 from langchain_core.documents import Document
 
 from src.config import RAW_DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP
-from src.rag.vectorstore import get_vectorstore
+from src.rag.vectorstore import embedding_model_id, get_vectorstore
 from src.ingestion.loaders import (
     discover_files,
     build_document_records,
-    build_chunks_for_record
+    build_chunks_for_record,
+    ingest_records,
+    iter_chunks_for_record,
+    iter_document_records
 )
 
-def _reindex_document_chunks(doc_id: str, chunks: List[Document]) -> int:
-    """Reindexa os chunks de um documento no vectorstore."""
-    vs = get_vectorstore()
+logger = logging.getLogger(__name__)
+
+# Tamanho dos lotes enviados ao vectorstore na ingestão em lote
+ADD_BATCH_SIZE = 1000
+
+# Metadados de cada chunk que definem como ele foi gerado/embutido: mudar
+# qualquer um (CHUNK_SIZE, CHUNK_OVERLAP, modelo) exige reindexar
+_PARAM_KEYS = ("chunk_size", "chunk_overlap", "embedding_model")
+
+# Uma ingestão por vez no processo: jobs em background (API) rodam em
+# threads e não podem intercalar delete/add_documents/persist no mesmo store
+_ingest_lock = threading.Lock()
+
+def _add_in_batches(vs, chunks: Iterable[Document]) -> int:
+    """
+    Adiciona `chunks` (pode ser um gerador) em lotes de ADD_BATCH_SIZE, em
+    pipeline: o add_documents (embedding) de um lote roda numa thread
+    enquanto a thread atual já monta o lote seguinte (extração/chunking ou
+    resultados do pool de processos). Só um add fica em andamento por vez
+    dentro do job, e _ingest_lock impede outro job de alterar o store ao
+    mesmo tempo.
+    """
+    total = 0
+    chunks = iter(chunks)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        adding = None
+        while batch := list(islice(chunks, ADD_BATCH_SIZE)):
+            if adding is not None:
+                adding.result()
+            adding = executor.submit(vs.add_documents, batch)
+            total += len(batch)
+        if adding is not None:
+            adding.result()
+    return total
+
+def _delete_stale_chunks(vs, doc_ids: Iterable[str], source_paths: Iterable[str] = (),
+                         live_doc_ids: Iterable[str] = ()):
+    """
+    Remove, numa única chamada a vs.delete, os chunks antigos dos documentos:
+    pelo doc_id e também pelo caminho do arquivo, já que um arquivo alterado
+    (ou um doc_id calculado com outro CHECKSUM_ALGO) tem um doc_id novo que
+    não casa com o antigo. Pelo caminho só saem chunks de conteúdo que não
+    está mais em disco (`live_doc_ids`: doc_ids encontrados nesta ingestão),
+    nunca os de uma cópia idêntica em outro arquivo.
+    """
+    doc_ids = sorted(set(doc_ids))
+    source_paths = sorted(set(source_paths))
+    if not doc_ids and not source_paths:
+        return
+    filtro = {"$or": [
+        {"doc_id": {"$in": doc_ids}},
+        {"$and": [
+            {"source_path": {"$in": source_paths}},
+            {"doc_id": {"$nin": sorted({*doc_ids, *live_doc_ids})}},
+        ]},
+    ]}
     try:
-        vs.delete(filter={"doc_id": doc_id})
+        vs.delete(filter=filtro)
     except Exception:
-        pass
-    if not chunks:
-        return 0
-    vs.add_documents(chunks)
+        # sem a remoção, o add em seguida duplicaria os documentos
+        logger.exception("Falha ao remover chunks antigos de %d documento(s)", len(doc_ids))
+        raise
+
+def _reindex_document_chunks(doc_id: str, chunks: Iterable[Document], source_path: Optional[str] = None) -> int:
+    """
+    Reindexa os chunks de um documento no vectorstore. `chunks` pode ser um
+    gerador: é consumido em lotes de ADD_BATCH_SIZE.
+    """
+    vs = get_vectorstore()
+    _delete_stale_chunks(vs, [doc_id], [source_path] if source_path else [])
+    total = _add_in_batches(vs, chunks)
     vs.persist()
-    return len(chunks)
-
-def ingest_directory(root: str = str(RAW_DATA_DIR)) -> Dict:
-    """Ingestão em lote a partir de root (ex.: ./data/raw)."""
-    base = discover_files(root)
-    validos, ignorados = build_document_records(root, base)
-
-    total_chunks = 0
-    total_docs = 0
-    for rec in validos:
-        chunks = build_chunks_for_record(rec, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-        n = _reindex_document_chunks(rec["doc_id"], chunks)
-        total_chunks += n
-        total_docs += 1
-
-    return {
-        "root": root,
-        "processed_docs": total_docs,
-        "indexed_chunks": total_chunks,
-        "ignored": ignorados
-    }
-
-def ingest_file(path: str, root: str = str(RAW_DATA_DIR)) -> bool:
-    """Ingestão de um único arquivo (após upload)."""
-    import os, datetime
-    ext = os.path.splitext(path)[1].lower()
+    return total
+
+def _index_params() -> Dict:
+    """Valores atuais de _PARAM_KEYS, gravados nos metadados de cada chunk."""
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "embedding_model": embedding_model_id()}
+
+def _with_params(chunks: Iterable[Document], params: Dict) -> Iterable[Document]:
+    for c in chunks:
+        c.metadata.update(params)
+        yield c
+
+def _index_state(vs, where: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    doc_id -> {"count", "source_paths", "params"} dos chunks em `vs`, montado
+    com um único get(): a ingestão não varre o store uma vez por registro.
+    """
+    state = {}
+    for meta in vs.get(where=where)["metadatas"]:
+        entry = state.setdefault(meta.get("doc_id"), {"count": 0, "source_paths": set(), "params": set()})
+        entry["count"] += 1
+        entry["source_paths"].add(meta.get("source_path"))
+        entry["params"].add(tuple(meta.get(k) for k in _PARAM_KEYS))
+    return state
+
+def _current_chunk_count(state: Dict[str, Dict], doc_id: str, source_paths: List[str], params: Dict) -> int:
+    """
+    Nº de chunks de `doc_id` já indexados a partir de um dos `source_paths`
+    e com os parâmetros atuais; 0 quando o documento precisa ser
+    (re)indexado: novo, movido/renomeado (título e categoria vêm do
+    caminho) ou indexado com outro chunking/modelo.
+    """
+    entry = state.get(doc_id)
+    if entry is None or entry["params"] != {tuple(params[k] for k in _PARAM_KEYS)}:
+        return 0
+    if not entry["source_paths"] <= set(source_paths):
+        return 0
+    return entry["count"]
+
+def ingest_directory(root: str = str(RAW_DATA_DIR), workers: Optional[int] = None, force: bool = False) -> Dict:
+    """
+    Ingestão em lote a partir de root (ex.: ./data/raw).
+
+    Remove as versões antigas e, em seguida, a extração + chunking roda em
+    paralelo num pool de processos (`workers`, padrão os.cpu_count(); os
+    processos partem de forkserver/spawn, ver ingest_records, porque esta
+    função roda em threads de background da API) enquanto
+    o processo principal já adiciona os chunks prontos em lotes de
+    ADD_BATCH_SIZE (ver _add_in_batches); o vectorstore é persistido uma
+    única vez. Documentos já indexados com o mesmo conteúdo, caminho e
+    parâmetros (_PARAM_KEYS) são pulados, a menos que `force`. Ingestões
+    concorrentes esperam umas pelas outras (_ingest_lock).
+    """
+    with _ingest_lock:
+        vs = get_vectorstore()
+
+        skipped_docs = 0
+        skipped_chunks = 0
+        to_index = []
+        # cópias idênticas (mesmo doc_id) de um arquivo na fila: só os chunks
+        # antigos do caminho delas são removidos, sem indexar de novo
+        duplicates = []
+        ignorados = []
+        groups: Dict[str, List[Dict]] = {}
+        for rec, ign in iter_document_records(root):
+            if ign:
+                ignorados.append(ign)
+            else:
+                groups.setdefault(rec["doc_id"], []).append(rec)
+
+        params = _index_params()
+        state = {} if force else _index_state(vs)
+        for doc_id, recs in groups.items():
+            n = _current_chunk_count(state, doc_id, [r["source_path"] for r in recs], params)
+            if n:
+                skipped_docs += len(recs)
+                skipped_chunks += n
+            else:
+                to_index.append(recs[0])
+                duplicates.extend(recs[1:])
+                skipped_docs += len(recs) - 1
+
+        # uma única remoção (uma varredura do store) antes do primeiro add:
+        # durante o pipeline só o add_documents em andamento altera o store
+        stale = list(chain(to_index, duplicates))
+        _delete_stale_chunks(
+            vs, [r["doc_id"] for r in stale], [r["source_path"] for r in stale], live_doc_ids=groups
+        )
+
+        processed = ingest_records(to_index, workers, CHUNK_SIZE, CHUNK_OVERLAP)
+        chunks = chain.from_iterable(chunks for _, chunks in processed)
+        total_chunks = _add_in_batches(vs, _with_params(chunks, params))
+        vs.persist()
+
+        return {
+            "root": root,
+            "processed_docs": len(to_index),
+            "indexed_chunks": total_chunks,
+            "skipped_docs": skipped_docs,
+            "skipped_chunks": skipped_chunks,
+            "ignored": ignorados
+        }
+
+def ingest_file(path: str, root: str = str(RAW_DATA_DIR), checksum: Optional[str] = None,
+                force: bool = False) -> bool:
+    """
+    Ingestão de um único arquivo (após upload).
+    Se `checksum` ("<algo>:<hex>") já foi calculado na gravação, ele é usado
+    como doc_id sem reler o arquivo. Um arquivo já indexado do mesmo caminho
+    e com os mesmos parâmetros não é reprocessado, a menos que `force`.
+    """
+    st = os.stat(path)
     discovered = [{
         "source_path": path,
-        "extension": ext,
-        "size_bytes": int(os.stat(path).st_size),
-        "modified_at": datetime.datetime.fromtimestamp(os.stat(path).st_mtime).isoformat()
+        "extension": Path(path).suffix.lower(),
+        "size_bytes": int(st.st_size),
+        "modified_at": datetime.datetime.fromtimestamp(st.st_mtime).isoformat()
     }]
+    if checksum:
+        discovered[0]["checksum"] = checksum
 
     validos, ignorados = build_document_records(root, discovered)
     if not validos:
@@ -59,15 +217,25 @@ def ingest_file(path: str, root: str = str(RAW_DATA_DIR)) -> bool:
         return False
 
     rec = validos[0]
-    chunks = build_chunks_for_record(rec, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    _reindex_document_chunks(rec["doc_id"], chunks)
-    return True
+    params = _index_params()
+    with _ingest_lock:
+        if not force:
+            state = _index_state(get_vectorstore(), where={"doc_id": rec["doc_id"]})
+            if _current_chunk_count(state, rec["doc_id"], [rec["source_path"]], params):
+                return True
+        chunks = _with_params(iter_chunks_for_record(rec, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP), params)
+        _reindex_document_chunks(rec["doc_id"], chunks, source_path=rec["source_path"])
+        return True
 
 # Modo de teste manual
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Ingestão de documentos para RAG")
     parser.add_argument("--mode", choices=["discover", "index"], default="discover")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processos para extração/chunking (padrão: nº de CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reindexa todos os documentos (ex.: após trocar CHUNK_SIZE ou o modelo)")
     args = parser.parse_args()
 
     if args.mode == "discover":
@@ -78,5 +246,5 @@ if __name__ == "__main__":
             chunks = build_chunks_for_record(rec, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
             print(f"- {rec['title']} ({rec['version']}) → {len(chunks)} chunk(s)")
     else:
-        stats = ingest_directory(str(RAW_DATA_DIR))
+        stats = ingest_directory(str(RAW_DATA_DIR), workers=args.workers, force=args.force)
         print("[Resumo]", stats)
\ No newline at end of file
@@ -1,15 +1,33 @@
 import os
 import datetime
+import gzip
 import logging
-from typing import List, Dict, Iterable, Tuple
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import hashlib
+import mmap
 import re
+from collections import deque
 
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_community.document_loaders.word_document import Docx2txtLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import numpy as np
 from langchain_core.documents import Document
 
+from src.config import CHECKSUM_ALGO, EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_MB, PDF_LOADER
+from src.jit import njit
+
+try:
+    import blake3
+except ImportError:  # sem blake3, o doc_id usa sha256
+    blake3 = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # sem pypdfium2, PDFs passam pelo PyPDFLoader
+    pdfium = None
+
 logger = logging.getLogger(__name__)
 
 # Extensões permitidas
@@ -24,13 +42,42 @@ def is_ignored_file(filename: str) -> bool:
             return True
     return False
 
+def _scan_files(root_dir: str) -> Iterator[Tuple[os.DirEntry, Tuple[str, ...]]]:
+    """
+    DFS iterativa com os.scandir: devolve (DirEntry, partes do diretório
+    relativas a root_dir) dos arquivos válidos. O stat do DirEntry fica em
+    cache (evita um stat extra por arquivo em relação ao os.walk).
+    Diretórios ocultos/temporários (.git, .venv, ~$...) não são percorridos
+    e links simbólicos para diretórios não são seguidos.
+    """
+    pending = deque([(root_dir, ())])
+    while pending:
+        dirpath, parts = pending.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_ignored_file(entry.name):
+                            pending.append((entry.path, parts + (entry.name,)))
+                    elif entry.is_file() and not is_ignored_file(entry.name):
+                        yield entry, parts
+        except OSError:
+            continue
+
 def filter_files(root_dir: str) -> Iterable[str]:
     """Itera recursivamente e retorna caminhos completos de arquivos válidos."""
-    for root, _, files in os.walk(root_dir):
-        for fn in files:
-            if is_ignored_file(fn):
-                continue
-            yield os.path.join(root, fn)
+    for entry, _ in _scan_files(root_dir):
+        yield entry.path
+
+def _file_item(entry: os.DirEntry, extension: str) -> Dict:
+    """Item de descoberta a partir do stat em cache do DirEntry."""
+    stat = entry.stat()
+    return {
+        "source_path": entry.path,
+        "extension": extension,
+        "size_bytes": int(stat.st_size),
+        "modified_at": datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(),
+    }
 
 def discover_files(root_dir: str) -> List[Dict]:
     """
@@ -44,26 +91,19 @@ def discover_files(root_dir: str) -> List[Dict]:
     if not os.path.exists(root_dir):
         return results
 
-    for path in filter_files(root_dir):   # <— corrigido (era 'ilter_files')
-        extension = os.path.splitext(path)[1].lower()
+    for entry, _ in _scan_files(root_dir):
+        extension = os.path.splitext(entry.name)[1].lower()
         if extension not in ALLOWED_EXTENSIONS:
             continue
         try:
-            stat = os.stat(path)
-            size_bytes = int(stat.st_size)
-            modified_at = datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
+            results.append(_file_item(entry, extension))
         except Exception:
             continue
-
-        results.append({
-            "source_path": path,
-            "extension": extension,
-            "size_bytes": size_bytes,
-            "modified_at": modified_at,
-        })
     return results
 
 _VERSION_RE = re.compile(r'^v\d{4}-\d{2}(-\d{2})?$')  # vYYYY-MM or vYYYY-MM-DD
+# <title>__<version>.<ext> numa única passada (title vai até o primeiro "__")
+_FILENAME_RE = re.compile(r'^(?P<title>.+?)__(?P<version>.+?)\.(?P<ext>txt|pdf|docx)$', re.IGNORECASE)
 
 def parse_path_metadata(source_path: str, root_dir: str) -> Tuple[Dict, Dict]:
     """
@@ -71,37 +111,45 @@ def parse_path_metadata(source_path: str, root_dir: str) -> Tuple[Dict, Dict]:
       <root_dir>/<category>/<system?>/<title>__<version>.<ext>
     onde category ∈ {processos, sistemas}
     """
-    norm_root = os.path.normpath(root_dir)
-    norm_path = os.path.normpath(source_path)
+    dirpath, filename = os.path.split(source_path)
+    category, system = _resolve_category_system(dirpath, root_dir)
+    return _metadata_from_filename(category, system, filename)
 
+@lru_cache(maxsize=4096)
+def _resolve_category_system(dirpath: str, root_dir: str) -> Tuple[str, Optional[str]]:
+    """
+    (category, system) do diretório `dirpath`, memoizado: todos os arquivos
+    de uma mesma pasta compartilham o mesmo normpath/relpath.
+    """
     try:
-        rel = os.path.relpath(norm_path, norm_root)
+        rel = os.path.relpath(os.path.normpath(dirpath), os.path.normpath(root_dir))
     except ValueError:
-        raise ValueError(f"O arquivo '{source_path}' não está dentro do diretório raiz '{root_dir}'")
+        raise ValueError(f"O diretório '{dirpath}' não está dentro do diretório raiz '{root_dir}'")
+    return _category_system(() if rel == os.curdir else tuple(rel.split(os.sep)))
 
-    parts = rel.split(os.sep)
-    if len(parts) < 2:
+@lru_cache(maxsize=4096)
+def _category_system(dir_parts: Tuple[str, ...]) -> Tuple[str, Optional[str]]:
+    """(category, system) a partir das partes do diretório relativo a root_dir."""
+    rel = os.sep.join(dir_parts)
+    if len(dir_parts) < 1:
         raise ValueError(f"Caminho relativo '{rel}' muito curto para extrair metadados.")
 
-    category = parts[0]
+    category = dir_parts[0]
     if category not in {"processos", "sistemas"}:
         raise ValueError(f"Categoria inválida '{category}' no caminho '{rel}'.")
 
-    system = None
-    filename = None
     if category == "sistemas":
-        if len(parts) < 3:
+        if len(dir_parts) < 2:
             raise ValueError(f"Caminho relativo '{rel}' muito curto para extrair sistema.")
-        system = parts[1]
-        filename = parts[2]
-    else:
-        filename = parts[1]
+        return category, dir_parts[1]
+    return category, None
 
-    name, _ext = os.path.splitext(filename)
-    if "__" not in name:
+def _metadata_from_filename(category: str, system: Optional[str], filename: str) -> Tuple[Dict, Dict]:
+    m = _FILENAME_RE.match(filename)
+    if m is None:
         return {}, {"reason": "missing_version_separator"}
 
-    title, version = name.split("__", 1)
+    title, version = m.group("title", "version")
 
     meta = {
         "category": category,
@@ -115,102 +163,429 @@ def parse_path_metadata(source_path: str, root_dir: str) -> Tuple[Dict, Dict]:
 
     return meta, {}
 
-def compute_checksum(source_path: str, algo: str = "sha256", block_size: int = 1 << 20) -> str:
-    if algo != "sha256":
-        raise ValueError("Only sha256 is supported in this version.")
+# Arquivos maiores que isto são hasheados via mmap; abaixo, o custo de
+# montar o mapa supera o de ler em blocos
+_MMAP_MIN_SIZE = 4 << 20
+
+# Arquivos até este tamanho são hasheados numa única chamada sobre o mmap
+_MMAP_SINGLE_PASS_LIMIT = 1 << 30
+
+# Buffer reutilizável da leitura em blocos (arquivos pequenos)
+_READ_BLOCK_SIZE = 1 << 17
+
+def _mmap_digest(fd: int, size: int, window_size: int):
+    """
+    SHA-256 via mmap: o hashlib lê direto do page cache numa única chamada
+    em C, sem bytes temporários. Acima de 1 GiB o mapa é percorrido em
+    janelas de `window_size` bytes.
+    """
     h = hashlib.sha256()
-    with open(source_path, "rb") as f:
-        while True:
-            chunk = f.read(block_size)
-            if not chunk:
-                break
-            h.update(chunk)
-    return f"sha256:{h.hexdigest()}"
-
-def build_document_records(root_dir: str, discovered: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
-    val: List[Dict] = []
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+        if size <= _MMAP_SINGLE_PASS_LIMIT:
+            h.update(mm)
+        else:
+            with memoryview(mm) as view:
+                for offset in range(0, size, window_size):
+                    h.update(view[offset:offset + window_size])
+    return h
+
+def _read_digest(f, algo: str):
+    """Hash em blocos com readinto num buffer reutilizável (arquivos pequenos)."""
+    if algo == "sha256" and hasattr(hashlib, "file_digest"):
+        return hashlib.file_digest(f, "sha256")
+    h = blake3.blake3() if algo == "blake3" else hashlib.sha256()
+    buf = bytearray(_READ_BLOCK_SIZE)
+    view = memoryview(buf)
+    while n := f.readinto(buf):
+        h.update(view[:n])
+    return h
+
+def checksum_algo() -> str:
+    """Algoritmo efetivo do doc_id: CHECKSUM_ALGO, ou sha256 se blake3 não estiver instalado."""
+    if CHECKSUM_ALGO == "blake3" and blake3 is not None:
+        return "blake3"
+    return "sha256"
+
+def new_hasher() -> Tuple[str, object]:
+    """(algoritmo, hasher incremental) para calcular o doc_id em streaming (ex.: upload)."""
+    algo = checksum_algo()
+    return algo, blake3.blake3() if algo == "blake3" else hashlib.sha256()
+
+def compute_checksum(source_path: str, algo: Optional[str] = None, window_size: int = 64 << 20) -> str:
+    """
+    Checksum do arquivo no formato "<algo>:<hex>" (padrão: checksum_algo()).
+
+    Arquivos até 4 MiB são lidos em blocos num buffer reutilizável
+    (hashlib.file_digest para sha256 no Python 3.11+). Acima disso o hash
+    lê direto do mmap: blake3 via update_mmap (árvore multi-thread) e
+    sha256 numa única chamada em C.
+    """
+    algo = algo or checksum_algo()
+    if algo not in {"blake3", "sha256"}:
+        raise ValueError(f"Algoritmo de checksum não suportado: {algo}")
+    if algo == "blake3" and blake3 is None:
+        raise ValueError("blake3 não está instalado.")
+    with open(source_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= _MMAP_MIN_SIZE:
+            h = _read_digest(f, algo)
+        elif algo == "blake3":
+            h = blake3.blake3(max_threads=blake3.blake3.AUTO)
+            h.update_mmap(source_path)
+        else:
+            h = _mmap_digest(f.fileno(), size, window_size)
+    return f"{algo}:{h.hexdigest()}"
+
+def _checksum_or_error(item: Dict) -> Tuple[str, str]:
+    """(checksum, "") em caso de sucesso, ("", mensagem) em caso de erro."""
+    try:
+        return item.get("checksum") or compute_checksum(item["source_path"]), ""
+    except Exception as e:
+        return "", str(e)
+
+def _build_record(item: Dict, meta: Dict, doc_id: str) -> Dict:
+    rec = {
+        "doc_id": doc_id,
+        "checksum": doc_id,
+        "source_path": item["source_path"],
+        "category": meta["category"],
+        "system": meta["system"],
+        "title": meta["title"],
+        "version": meta["version"],
+        "extension": item["extension"],
+        "size_bytes": item["size_bytes"],
+        "modified_at": item["modified_at"]
+    }
+    if meta.get("_version_warning"):
+        rec["_version_warning"] = meta["_version_warning"]
+    return rec
+
+def build_document_records(root_dir: str, discovered: List[Dict], max_workers: Optional[int] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Monta os registros dos arquivos descobertos. Os metadados de caminho são
+    extraídos em série; os checksums são calculados em paralelo numa thread
+    pool (o hashlib libera o GIL), preservando a ordem de `discovered`.
+    """
     ign: List[Dict] = []
+    parsed: List[Tuple[Dict, Dict]] = []
     for item in discovered:
-        source_path = item["source_path"]
-        ext = item["extension"]
-
-        meta, err = parse_path_metadata(source_path, root_dir)
+        meta, err = parse_path_metadata(item["source_path"], root_dir)
         if err:
-            ign.append({"source_path": source_path, "reason": err["reason"]})
+            ign.append({"source_path": item["source_path"], "reason": err["reason"]})
             continue
+        parsed.append((item, meta))
 
-        try:
-            doc_id = compute_checksum(source_path)
-        except Exception as e:
-            ign.append({"source_path": source_path, "reason": f"checksum_error: {e}"})
-            continue
+    workers = max_workers or os.cpu_count() or 1
+    if len(parsed) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(parsed))) as executor:
+            checksums = list(executor.map(_checksum_or_error, [item for item, _ in parsed]))
+    else:
+        checksums = [_checksum_or_error(item) for item, _ in parsed]
 
-        rec = {
-            "doc_id": doc_id,
-            "source_path": source_path,
-            "category": meta["category"],
-            "system": meta["system"],
-            "title": meta["title"],
-            "version": meta["version"],
-            "extension": ext,
-            "size_bytes": item["size_bytes"],
-            "modified_at": item["modified_at"]
-        }
-        if meta.get("_version_warning"):
-            rec["_version_warning"] = meta["_version_warning"]
-        val.append(rec)
+    val: List[Dict] = []
+    for (item, meta), (doc_id, error) in zip(parsed, checksums):
+        if error:
+            ign.append({"source_path": item["source_path"], "reason": f"checksum_error: {error}"})
+            continue
+        val.append(_build_record(item, meta, doc_id))
 
     return val, ign
 
+def iter_document_records(root_dir: str, max_workers: Optional[int] = None) -> Iterator[Tuple[Optional[Dict], Optional[Dict]]]:
+    """
+    discover_files + build_document_records numa única passada: percorre
+    root_dir com os.scandir e devolve, à medida que ficam prontos,
+    (registro, None) para documentos válidos ou (None, ignorado).
+
+    Os checksums rodam numa thread pool com no máximo 2 * max_workers
+    arquivos em voo; a ordem da varredura é preservada.
+    """
+    if not os.path.exists(root_dir):
+        return
+    workers = max_workers or os.cpu_count() or 1
+    in_flight = deque()
+
+    def finish(item, meta, future):
+        doc_id, error = future.result()
+        if error:
+            return None, {"source_path": item["source_path"], "reason": f"checksum_error: {error}"}
+        return _build_record(item, meta, doc_id), None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry, parts in _scan_files(root_dir):
+            extension = os.path.splitext(entry.name)[1].lower()
+            if extension not in ALLOWED_EXTENSIONS:
+                continue
+            meta, err = _metadata_from_filename(*_category_system(parts), entry.name)
+            if err:
+                yield None, {"source_path": entry.path, "reason": err["reason"]}
+                continue
+            try:
+                item = _file_item(entry, extension)
+            except Exception:
+                continue
+            in_flight.append((item, meta, executor.submit(_checksum_or_error, item)))
+            while len(in_flight) > 2 * workers:
+                yield finish(*in_flight.popleft())
+        while in_flight:
+            yield finish(*in_flight.popleft())
+
+def _load_pdf_pdfium(source_path: str) -> List[Document]:
+    """Uma página por Document, como o PyPDFLoader, extraída pelo PDFium."""
+    pdf = pdfium.PdfDocument(source_path)
+    try:
+        docs = []
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+            docs.append(Document(page_content=text, metadata={"source": source_path, "page": i}))
+        return docs
+    finally:
+        pdf.close()
+
 def extract_text_docs(source_path: str, extension: str):
+    """
+    Carrega o arquivo e normaliza o texto uma única vez, já no carregamento.
+
+    Os loaders do langchain_community são importados só quando usados: o
+    pacote custa ~0,5 s de import em cada worker de ingestão e, com
+    PDF_LOADER=pdfium, nem sempre é necessário.
+    """
     ext = extension.lower()
     try:
         if ext == ".pdf":
-            return PyPDFLoader(source_path).load()
+            if PDF_LOADER == "pdfium" and pdfium is not None:
+                docs = _load_pdf_pdfium(source_path)
+            else:
+                from langchain_community.document_loaders import PyPDFLoader
+
+                docs = PyPDFLoader(source_path).load()
         elif ext == ".docx":
-            return Docx2txtLoader(source_path).load()
+            from langchain_community.document_loaders.word_document import Docx2txtLoader
+
+            docs = Docx2txtLoader(source_path).load()
         elif ext == ".txt":
-            return TextLoader(source_path, encoding="utf-8").load()
+            from langchain_community.document_loaders import TextLoader
+
+            docs = TextLoader(source_path, encoding="utf-8").load()
         else:
             raise ValueError(f"Extensão não suportada: {ext}")
     except Exception as e:
         logger.exception("Erro ao carregar arquivo para extração: %s", source_path)
         return []
+    for d in docs:
+        d.page_content = _normalize_text(d.page_content)
+    return docs
+
+# \r vira \n; o \r\n resultante ("\n\n") é colapsado junto com as linhas em branco
+_CRLF_TABLE = str.maketrans({"\r": "\n"})
+_MULTI_NL = re.compile(r"\n{2,}")
 
 def _normalize_text(text: str) -> str:
     if not text:
         return ""
-    t = text.replace("\r\n", "\n").replace("\r", "\n")
-    while "\n\n" in t:
-        t = t.replace("\n\n", "\n")
-    return t.strip()
+    return _MULTI_NL.sub("\n", text.translate(_CRLF_TABLE)).strip()
 
-def chunk_document(docs, chunk_size: int = 1000, chunk_overlap: int = 200):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", " ", ""]
-    )
+# Espaços em branco considerados separadores de token no chunking
+_WHITESPACE = np.array([ord(c) for c in " \t\n\r\f\v\xa0"], dtype=np.uint32)
+
+def _token_bounds(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices (início, fim) de cada token separado por espaço em branco."""
+    if not text:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    is_tok = np.concatenate(([0], ~np.isin(codes, _WHITESPACE), [0])).astype(np.int8)
+    edges = np.diff(is_tok)
+    starts = np.flatnonzero(edges == 1).astype(np.int32)
+    ends = np.flatnonzero(edges == -1).astype(np.int32)
+    return starts, ends
+
+def _split_long_tokens(starts: np.ndarray, ends: np.ndarray, max_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quebra tokens com mais de `max_len` caracteres (URLs, base64, tabelas sem
+    espaço) em pedaços de `max_len`: nenhum chunk passa de chunk_size.
+    """
+    lengths = ends - starts
+    if max_len <= 0 or lengths.max(initial=0) <= max_len:
+        return starts, ends
+    pieces = -(-lengths // max_len)
+    token = np.repeat(np.arange(starts.shape[0]), pieces)
+    first_piece = np.repeat(np.cumsum(pieces) - pieces, pieces)
+    new_starts = starts[token] + (np.arange(token.shape[0]) - first_piece).astype(starts.dtype) * max_len
+    new_ends = np.minimum(new_starts + max_len, ends[token])
+    return new_starts, new_ends
+
+@njit(cache=True)
+def window_indices(starts, ends, chunk_size, overlap):
+    """
+    Janela deslizante sobre os tokens: cada janela tem até chunk_size
+    caracteres e a seguinte recomeça no primeiro token que cabe nos últimos
+    `overlap` caracteres. Retorna um array [n, 2] de (start_char, end_char).
+    """
+    n = starts.shape[0]
+    out = np.empty((n, 2), dtype=np.int64)
+    count = 0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and ends[j + 1] - starts[i] <= chunk_size:
+            j += 1
+        out[count, 0] = starts[i]
+        out[count, 1] = ends[j]
+        count += 1
+        if j == n - 1:
+            break
+        t = j + 1
+        while t - 1 > i and ends[j] - starts[t - 1] <= overlap:
+            t -= 1
+        i = t
+    return out[:count]
+
+def iter_chunks(docs, chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[Document]:
+    """
+    Gera os chunks documento a documento, sem materializar a lista inteira.
+    O texto já chega normalizado por extract_text_docs.
+    """
     for d in docs:
-        d.page_content = _normalize_text(d.page_content)
-    return splitter.split_documents(docs)
+        starts, ends = _split_long_tokens(*_token_bounds(d.page_content), chunk_size)
+        for start, end in window_indices(starts, ends, chunk_size, chunk_overlap):
+            yield Document(page_content=d.page_content[start:end], metadata=dict(d.metadata))
 
-def build_chunks_for_record(record: dict, chunk_size: int = 1000, chunk_overlap: int = 200):
+def chunk_document(docs, chunk_size: int = 1000, chunk_overlap: int = 200):
+    return list(iter_chunks(docs, chunk_size, chunk_overlap))
+
+def _extract_cache_path(record: dict) -> Optional[str]:
+    """Arquivo do cache para o doc_id; PDFs incluem o loader, que muda o texto extraído."""
+    if not EXTRACT_CACHE_DIR:
+        return None
+    name = record["doc_id"].replace(":", "_")
+    if record["extension"].lower() == ".pdf":
+        name += "_pdfium" if PDF_LOADER == "pdfium" and pdfium is not None else "_pypdf"
+    return os.path.join(EXTRACT_CACHE_DIR, name + ".pkl.gz")
+
+def _evict_extract_cache(max_bytes: int):
+    """Remove os arquivos de uso mais antigo (mtime) até o cache caber em `max_bytes`."""
+    entries = []
+    with os.scandir(EXTRACT_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".pkl.gz"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # já removido por outro worker
+        total -= size
+
+def extract_text_docs_cached(record: dict) -> List[Document]:
+    """
+    extract_text_docs com cache em disco por doc_id (checksum do conteúdo):
+    reingestões do mesmo arquivo não reprocessam o PDF/DOCX. O cache fica
+    limitado a EXTRACT_CACHE_MAX_MB (um hit atualiza o mtime do arquivo).
+    """
+    cache_path = _extract_cache_path(record)
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with gzip.open(cache_path, "rb") as f:
+                docs = pickle.load(f)
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            # mesmo conteúdo pode estar em outro caminho (cópia, renomeação)
+            for d in docs:
+                d.metadata["source"] = record["source_path"]
+            return docs
+        except Exception:
+            logger.warning("Cache de extração inválido, reprocessando: %s", cache_path)
+
+    docs = extract_text_docs(record["source_path"], record["extension"])
+    if cache_path and docs:
+        try:
+            os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=1) as f:
+                pickle.dump(docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+            _evict_extract_cache(EXTRACT_CACHE_MAX_MB << 20)
+        except OSError:
+            logger.warning("Falha ao gravar cache de extração: %s", cache_path)
+    return docs
+
+def iter_chunks_for_record(record: dict, chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[Document]:
+    """Extrai o registro e gera seus chunks já com os metadados do documento."""
     source_path = record["source_path"]
-    extension = record["extension"]
-    docs = extract_text_docs(source_path, extension)
+    docs = extract_text_docs_cached(record)
     if not docs:
         logger.warning("Nenhum documento extraído de %s", source_path)
-        return []
-    chunks = chunk_document(docs, chunk_size, chunk_overlap)
-    logger.info("Chunks gerados para %s: %d", source_path, len(chunks))
-    for c in chunks:
-        c.metadata.update({
-            "doc_id": record["doc_id"],
-            "source_path": source_path,
-            "category": record["category"],
-            "system": record["system"],
-            "title": record["title"],
-            "version": record["version"],
-        })
-    return chunks
+        return
+    # Metadados comuns a todos os chunks do registro, montados uma única vez
+    shared = {
+        "doc_id": record["doc_id"],
+        "checksum": record["checksum"],
+        "source_path": source_path,
+        "category": record["category"],
+        "system": record["system"],
+        "title": record["title"],
+        "version": record["version"],
+    }
+    n = 0
+    for c in iter_chunks(docs, chunk_size, chunk_overlap):
+        c.metadata.update(shared)
+        n += 1
+        yield c
+    logger.info("Chunks gerados para %s: %d", source_path, n)
+
+def build_chunks_for_record(record: dict, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """Versão materializada de iter_chunks_for_record (usada no pool de processos)."""
+    return list(iter_chunks_for_record(record, chunk_size, chunk_overlap))
+
+def _process_context():
+    """Contexto multiprocessing do pool de ingestão: forkserver quando existe, senão spawn."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def ingest_records(records: Iterable[Dict], workers: Optional[int] = None,
+                   chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[Tuple[Dict, List[Document]]]:
+    """
+    Executa build_chunks_for_record para cada registro num pool de processos
+    (`workers`, padrão os.cpu_count()) e devolve (registro, chunks) na ordem
+    de `records`, à medida que ficam prontos. No máximo 2 * workers
+    registros ficam em voo: chunks prontos não se acumulam na memória
+    enquanto o consumidor ainda está gerando embeddings.
+
+    Os processos partem de um forkserver (spawn no Windows), nunca de fork:
+    na API o pool é criado numa thread de background de um processo com
+    outras threads e locks (uvicorn, sqlite, torch, logging), e um fork nesse
+    estado pode travar o filho. Com workers=1 tudo roda no próprio processo.
+    """
+    build = partial(build_chunks_for_record, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for rec in records:
+            yield rec, build(rec)
+        return
+
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_process_context()) as executor:
+        for rec in records:
+            in_flight.append((rec, executor.submit(build, rec)))
+            while len(in_flight) > 2 * workers:
+                rec_done, future = in_flight.popleft()
+                yield rec_done, future.result()
+        while in_flight:
+            rec_done, future = in_flight.popleft()
+            yield rec_done, future.result()
@@ -0,0 +1,18 @@
+"""
+Decoradores do Numba com fallback para Python puro.
+
+O Numba acelera laços numéricos (chunking, similaridade), mas é opcional:
+sem ele as mesmas funções rodam interpretadas.
+"""
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import List, Sequence
+
+import numpy as np
+
+
+class CachedEmbeddings:
+    """
+    Envolve um modelo de embeddings (interface LangChain) com um cache
+    persistente em SQLite: blake2b(texto) -> embedding float32.
+
+    embed_documents só envia ao modelo os textos ainda não vistos, numa única
+    chamada; chunks que não mudaram entre versões de um manual não são
+    recodificados. `namespace` separa modelos/provedores diferentes.
+
+    Os vetores devolvidos são array("f") (buffer float32 tipado, lido direto
+    do BLOB) em vez de listas de float: nada é convertido em PyFloat por
+    elemento, e np.asarray sobre eles é uma cópia de memória.
+    """
+
+    def __init__(self, inner, db_path: str | Path, namespace: str = ""):
+        self.inner = inner
+        self.namespace = namespace
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        data = f"{self.namespace}\0{text}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def _fetch(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):  # limite de parâmetros do SQLite
+                batch = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update((k, array("f", v)) for k, v in rows)
+        return found
+
+    def embed_documents(self, texts: List[str]) -> List[Sequence[float]]:
+        keys = [self._key(t) for t in texts]
+        cached = self._fetch(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            rows = [
+                (key, np.asarray(vec, dtype=np.float32).tobytes())
+                for key, vec in zip(missing.keys(), vectors)
+            ]
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+                self._conn.commit()
+            cached.update((key, array("f", blob)) for key, blob in rows)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[Sequence[float]]:
+        """Consultas em lote direto no modelo: perguntas não entram no cache de chunks."""
+        return self.inner.embed_documents(texts)
@@ -1,4 +1,7 @@
 ﻿import logging
+import threading
+from functools import lru_cache
+from itertools import takewhile
 from typing import List, Tuple, Any
 
 from langchain_core.prompts import ChatPromptTemplate
@@ -13,16 +16,54 @@ from src.config import (
     AZURE_OPENAI_API_VERSION,
     AZURE_OPENAI_CHAT_DEPLOYMENT,
 )
-from src.rag.vectorstore import get_vectorstore
+from src.rag.qvcache import get_query_cache
+from src.rag.vectorstore import embed_queries, get_embeddings, get_vectorstore
 
 logger = logging.getLogger(__name__)
 
 
+# Geração do índice: avança a cada invalidação e entra na chave do cache
+# exato. Uma busca iniciada antes da invalidação grava sob a geração antiga
+# (nunca mais consultada) e não repõe seus hits no QVCache.
+_store_generation = 0
+_generation_lock = threading.Lock()
+
+
+def _put_if_current(cache, q_vec, k: int, hits, generation: int):
+    """Grava no QVCache só se o índice não mudou desde o início da busca."""
+    with _generation_lock:
+        if generation == _store_generation:
+            cache.put(q_vec, k, hits)
+
+
+@lru_cache(maxsize=512)
+def _retrieve_cached(query_normalized: str, k: int, generation: int) -> Tuple[Tuple[Any, float], ...]:
+    """
+    Cache exato (pergunta normalizada, k, geração) -> hits, na frente do
+    QVCache: a repetição da mesma pergunta não paga nem o embedding da consulta.
+    """
+    cache = get_query_cache()
+    q_vec = get_embeddings().embed_query(query_normalized)
+    hits = cache.lookup(q_vec, k)
+    if hits is None:
+        hits = get_vectorstore().similarity_search_with_score_by_vector(q_vec, k=k)
+        _put_if_current(cache, q_vec, k, hits, generation)
+    return tuple(hits)
+
+
+def clear_retrieval_caches():
+    """Descarta os caches de retrieval (exato e QVCache) após mudanças no índice."""
+    global _store_generation
+    with _generation_lock:
+        _store_generation += 1
+        _retrieve_cached.cache_clear()
+        get_query_cache().clear()
+
+
 class RAGGenerator:
-    def __init__(self):
-        self._llm = None
-        self._prompt = ChatPromptTemplate.from_template(
-            """Voce e um assistente de suporte P&S. Use SOMENTE o contexto para responder de forma objetiva.
+    # Template parseado uma vez por processo e compartilhado entre instâncias
+    _prompt = ChatPromptTemplate.from_template(
+        """Voce e um assistente de suporte P&S. Use SOMENTE o contexto para responder de forma objetiva.
 Se o contexto nao contiver a resposta, diga que nao encontrou nos manuais.
 Responda em portugues e, quando fizer sentido, em passos numerados.
 
@@ -32,7 +73,11 @@ Contexto:
 Pergunta: {question}
 
 Resposta:"""
-        )
+    )
+
+    def __init__(self):
+        self._llm = None
+        self._chain = None
 
     def _get_llm(self):
         if self._llm is None:
@@ -58,21 +103,48 @@ Resposta:"""
                 raise RuntimeError(f"LLM_PROVIDER invalido: {LLM_PROVIDER}")
         return self._llm
 
+    def _get_chain(self):
+        """Cadeia prompt | llm, montada uma vez por instância."""
+        if self._chain is None:
+            self._chain = self._prompt | self._get_llm()
+        return self._chain
+
     def _retrieve(self, query: str, k: int) -> List[Tuple[Any, float]]:
-        vs = get_vectorstore()
-        return vs.similarity_search_with_score(query, k=k)
+        """
+        Busca os top-k em dois níveis: cache exato da pergunta (espaços
+        normalizados) e, em seguida, hits de perguntas semelhantes (QVCache).
+        """
+        return list(_retrieve_cached(" ".join(query.split()), k, _store_generation))
+
+    def _retrieve_batch(self, queries: List[str], k: int) -> List[List[Tuple[Any, float]]]:
+        """
+        Busca os top-k de várias perguntas de uma vez: um único embedding em
+        lote e uma única busca no vectorstore para as que não estão no QVCache.
+        """
+        if not queries:
+            return []
+        generation = _store_generation
+        cache = get_query_cache()
+        q_vecs = embed_queries([" ".join(q.split()) for q in queries], get_embeddings())
+        results = [cache.lookup(q_vec, k) for q_vec in q_vecs]
+        misses = [i for i, hits in enumerate(results) if hits is None]
+        if misses:
+            found = get_vectorstore().similarity_search_batch_by_vector([q_vecs[i] for i in misses], k=k)
+            for i, hits in zip(misses, found):
+                _put_if_current(cache, q_vecs[i], k, hits, generation)
+                results[i] = hits
+        return results
 
     def _build_context(
         self, hits: List[Tuple[Any, float]], min_score: float = 0.0
     ) -> Tuple[str, List[str]]:
-        ctxs, sources = [], []
-        for doc, score in hits:
-            if score < min_score:
-                continue
-            ctxs.append(doc.page_content)
-            src = doc.metadata.get("source_path", "desconhecido")
-            sources.append(src)
-        return "\n\n---\n\n".join(ctxs), list(dict.fromkeys(sources))
+        # Os vectorstores devolvem os hits em similaridade decrescente: o
+        # primeiro abaixo de min_score encerra a varredura.
+        docs = [doc for doc, _ in takewhile(lambda hit: hit[1] >= min_score, hits)]
+        context = "\n\n---\n\n".join(doc.page_content for doc in docs)
+        # Fontes sem repetição, na ordem de relevância
+        sources = list(dict.fromkeys(doc.metadata.get("source_path", "desconhecido") for doc in docs))
+        return context, sources
 
     def _fallback_answer(self, context: str) -> str:
         """Retorna fallback com resumo curto do contexto quando o LLM falha."""
@@ -88,51 +160,76 @@ Resposta:"""
             return "Contexto encontrado, mas o LLM esta indisponivel."
 
         lines = ["Contexto encontrado, mas o LLM esta indisponivel. Resumo do contexto:"]
-        for i, snippet in enumerate(snippets, 1):
-            lines.append(f"{i}. {snippet}...")
+        lines.extend(str(i) + ". " + snippet + "..." for i, snippet in enumerate(snippets, 1))
         return "\n".join(lines)
 
-    def generate(self, query: str, k: int = 5, min_score: float = 0.0) -> dict:
-        try:
-            hits = self._retrieve(query, k=k)
-            context, sources = self._build_context(hits, min_score=min_score)
-
-            if not context.strip():
-                return {
-                    "question": query,
-                    "answer": "Nao encontrei informacao suficiente nos manuais para responder.",
-                    "context": "",
-                    "sources": [],
-                    "status": "no_context",
-                }
-
-            try:
-                llm = self._get_llm()
-                chain = self._prompt | llm
-                resp = chain.invoke({"context": context, "question": query})
-                answer = resp.content
-            except Exception as e:
-                logger.warning(f"LLM indisponivel, usando fallback: {e}")
-                answer = self._fallback_answer(context)
+    def _answer(self, query: str, hits: List[Tuple[Any, float]], min_score: float) -> dict:
+        """Monta o contexto a partir dos hits e gera a resposta (ou o fallback)."""
+        context, sources = self._build_context(hits, min_score=min_score)
 
+        if not context.strip():
             return {
                 "question": query,
-                "answer": answer,
-                "context": context,
-                "sources": sources,
-                "status": "success",
+                "answer": "Nao encontrei informacao suficiente nos manuais para responder.",
+                "context": "",
+                "sources": [],
+                "status": "no_context",
             }
 
+        llm_fallback = False
+        try:
+            resp = self._get_chain().invoke({"context": context, "question": query})
+            answer = resp.content
+        except Exception as e:
+            logger.warning(f"LLM indisponivel, usando fallback: {e}")
+            answer = self._fallback_answer(context)
+            llm_fallback = True
+
+        return {
+            "question": query,
+            "answer": answer,
+            "context": context,
+            "sources": sources,
+            "status": "success",
+            "llm_fallback": llm_fallback,
+        }
+
+    def _error_result(self, query: str, error: Exception) -> dict:
+        return {
+            "question": query,
+            "answer": "Erro ao processar a pergunta.",
+            "context": "",
+            "sources": [],
+            "status": "error",
+            "error": str(error),
+        }
+
+    def generate(self, query: str, k: int = 5, min_score: float = 0.0) -> dict:
+        try:
+            return self._answer(query, self._retrieve(query, k=k), min_score)
         except Exception as e:
             logger.error(f"Erro em generate: {e}")
-            return {
-                "question": query,
-                "answer": "Erro ao processar a pergunta.",
-                "context": "",
-                "sources": [],
-                "status": "error",
-                "error": str(e),
-            }
+            return self._error_result(query, e)
+
+    def generate_batch(self, queries: List[str], k: int = 5, min_score: float = 0.0) -> List[dict]:
+        """
+        Como generate para várias perguntas: o retrieval sai de um único
+        embedding em lote e de uma única busca no vectorstore.
+        """
+        try:
+            all_hits = self._retrieve_batch(queries, k=k)
+        except Exception as e:
+            logger.error(f"Erro em generate_batch: {e}")
+            return [self._error_result(query, e) for query in queries]
+
+        results = []
+        for query, hits in zip(queries, all_hits):
+            try:
+                results.append(self._answer(query, hits, min_score))
+            except Exception as e:
+                logger.error(f"Erro em generate_batch: {e}")
+                results.append(self._error_result(query, e))
+        return results
 
     def generate_with_sources(self, query: str, k: int = 5) -> dict:
         try:
@@ -147,20 +244,21 @@ Resposta:"""
 
             context, sources = self._build_context(hits, min_score=0.0)
 
+            llm_fallback = False
             try:
-                llm = self._get_llm()
-                chain = self._prompt | llm
-                resp = chain.invoke({"context": context, "question": query})
+                resp = self._get_chain().invoke({"context": context, "question": query})
                 answer = resp.content
             except Exception as e:
                 logger.warning(f"LLM indisponivel, usando fallback: {e}")
                 answer = self._fallback_answer(context)
+                llm_fallback = True
 
             return {
                 "question": query,
                 "answer": answer,
                 "sources": sources,
                 "status": "success",
+                "llm_fallback": llm_fallback,
             }
 
         except Exception as e:
@@ -0,0 +1,26 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def quantize_int8(vectors) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Quantiza vetores float32 para int8 usando min/max por linha.
+
+    Returns:
+        (codes int8 [N, D], offsets float32 [N], scales float32 [N]) tais que
+        vetor ≈ (codes + 128) * scale + offset
+    """
+    mat = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    mins = mat.min(axis=1)
+    maxs = mat.max(axis=1)
+    scales = (maxs - mins) / 255.0
+    scales[scales == 0.0] = 1.0
+    codes = np.rint((mat - mins[:, None]) / scales[:, None]) - 128.0
+    return codes.astype(np.int8), mins.astype(np.float32), scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, offsets: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Reconstrói (aproximadamente) os vetores float32 a partir de quantize_int8."""
+    mat = codes.astype(np.float32) + 128.0
+    return mat * scales[:, None] + offsets[:, None]
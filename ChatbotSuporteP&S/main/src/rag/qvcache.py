@@ -0,0 +1,104 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import QVCACHE_MAX_SIZE, QVCACHE_TTL_SECONDS, QVCACHE_THRESHOLD
+from src.rag.quantization import quantize_int8, dequantize_int8
+
+_cache_singleton = None
+
+
+class QueryVectorCache:
+    """
+    Cache de similaridade de consultas: reaproveita os hits (top-k) de uma
+    pergunta anterior cujo embedding esteja a menos de `threshold` de
+    distância de cosseno da pergunta atual.
+
+    Entradas: {q_id: (q_emb_int8, offset, scale, k, hits, ts)}, com despejo
+    LRU e expiração por TTL.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 600.0, threshold: float = 0.05):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, float, float, int, List[Tuple[Any, float]], float]]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = np.linalg.norm(v)
+        return v / n if n > 0.0 else v
+
+    def _expire(self, now: float):
+        expired = [qid for qid, e in self._entries.items() if now - e[5] > self.ttl_seconds]
+        for qid in expired:
+            del self._entries[qid]
+        if expired:
+            self._matrix = None
+
+    def _stacked(self) -> np.ndarray:
+        """Matriz [N, D] com os embeddings em cache (dequantizados e normalizados)."""
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            codes = np.stack([self._entries[qid][0] for qid in self._matrix_ids])
+            offsets = np.array([self._entries[qid][1] for qid in self._matrix_ids], dtype=np.float32)
+            scales = np.array([self._entries[qid][2] for qid in self._matrix_ids], dtype=np.float32)
+            mat = dequantize_int8(codes, offsets, scales)
+            norms = np.linalg.norm(mat, axis=1, keepdims=True)
+            norms[norms == 0.0] = 1.0
+            self._matrix = mat / norms
+        return self._matrix
+
+    def lookup(self, query_vec, k: int) -> Optional[List[Tuple[Any, float]]]:
+        """Retorna os hits em cache para uma consulta próxima, ou None."""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            self._expire(time.monotonic())
+            if not self._entries:
+                return None
+            sims = self._stacked() @ self._unit(query_vec)
+            best = int(np.argmax(sims))
+            qid = self._matrix_ids[best]
+            entry = self._entries[qid]
+            if 1.0 - float(sims[best]) >= self.threshold or entry[3] < k:
+                return None
+            self._entries.move_to_end(qid)
+            return entry[4][:k]
+
+    def put(self, query_vec, k: int, hits: List[Tuple[Any, float]]):
+        if self.max_size <= 0:
+            return
+        codes, offsets, scales = quantize_int8(self._unit(query_vec))
+        with self._lock:
+            self._entries[next(self._ids)] = (
+                codes[0], float(offsets[0]), float(scales[0]), k, list(hits), time.monotonic()
+            )
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+
+def get_query_cache() -> QueryVectorCache:
+    global _cache_singleton
+    if _cache_singleton is None:
+        _cache_singleton = QueryVectorCache(
+            max_size=QVCACHE_MAX_SIZE,
+            ttl_seconds=QVCACHE_TTL_SECONDS,
+            threshold=QVCACHE_THRESHOLD,
+        )
+    return _cache_singleton
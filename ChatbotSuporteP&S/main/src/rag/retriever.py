@@ -12,30 +12,26 @@ class Retriever:
 
     def retrieve(self, query: str, k: int = 5, min_score: float = 0.0) -> List[Dict]:
         try:
-            results = self.vs.similarity_search_with_score(query, k=k)
-            out = []
-            for doc, score in results:
-                if score < min_score:
-                    continue
-                out.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "score": score
-                })
-            logger.info(f"Recuperados {len(out)} documentos para: {query}")
+            # o store já corta no primeiro hit abaixo de min_score
+            results = self.vs.similarity_search_with_score(query, k=k, min_score=min_score)
+            out = [
+                {"content": doc.page_content, "metadata": doc.metadata, "score": score}
+                for doc, score in results
+            ]
+            logger.info("Recuperados %d documentos para: %s", len(out), query)
             return out
         except Exception as e:
-            logger.error(f"Erro ao recuperar documentos: {e}")
+            logger.error("Erro ao recuperar documentos: %s", e)
             return []
 
+    @staticmethod
+    def _format_hit(i: int, r: Dict) -> str:
+        source = r["metadata"].get("source_path", "desconhecido")
+        content = r["content"][:500].replace("\n", " ")
+        return f"[{i}] Fonte: {source} (relevância: {r['score']:.2f})\n{content}...\n"
+
     def retrieve_context(self, query: str, k: int = 5, min_score: float = 0.0) -> str:
         results = self.retrieve(query, k=k, min_score=min_score)
         if not results:
             return "Nenhum documento relevante encontrado."
-        parts = []
-        for i, r in enumerate(results, 1):
-            source = r["metadata"].get("source_path", "desconhecido")
-            score = r["score"]
-            content = r["content"][:500].replace("\n", " ")
-            parts.append(f"[{i}] Fonte: {source} (relevância: {score:.2f})\n{content}...\n")
-        return "\n".join(parts)
\ No newline at end of file
+        return "\n".join(self._format_hit(i, r) for i, r in enumerate(results, 1))
@@ -1,128 +1,949 @@
 ﻿# -*- coding: utf-8 -*-
+import logging
 import os
-import json
-import math
-from typing import List, Tuple, Dict, Any
+import re
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple, Dict, Any
 
+import msgspec
+import numpy as np
 from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import AzureOpenAIEmbeddings
+
+try:
+    import faiss
+except ImportError:  # opcional: sem faiss a busca exata usa simsimd ou numpy
+    faiss = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
 
 from src.config import (
     CHROMA_PERSIST_DIR,
     EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DEVICE,
+    EMBEDDING_DTYPE,
     EMBEDDING_PROVIDER,
+    EMBEDDING_PRECISION,
+    EMBED_CACHE_PATH,
+    VECTORSTORE,
+    FAISS_INDEX_FACTORY,
+    FAISS_TRAIN_SIZE,
+    FAISS_NPROBE,
+    FAISS_EF_SEARCH,
     AZURE_OPENAI_ENDPOINT,
     AZURE_OPENAI_API_KEY,
     AZURE_OPENAI_API_VERSION,
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
 )
+from src.jit import NUMBA_AVAILABLE, njit, prange
+from src.rag.embed_cache import CachedEmbeddings
+from src.rag.quantization import quantize_int8, dequantize_int8
+
+logger = logging.getLogger(__name__)
 
 _embeddings_singleton = None
 _store_singleton = None
+# Reentrante: criar o store chama get_embeddings(). Chamadas concorrentes
+# (pré-carga + primeira pergunta) esperam a mesma instância ficar pronta.
+_singletons_lock = threading.RLock()
+
+
+class BatchEncoder:
+    """
+    Embeddings locais via SentenceTransformer, codificando a lista inteira em
+    lotes de `batch_size` e já normalizados (cosseno = produto interno).
+
+    device/dtype "auto" usam CUDA em float16 quando disponível, senão CPU em
+    float32; corpus e consultas passam sempre pelo mesmo modelo. "float16"
+    converte os pesos (.half()); "bfloat16" mantém os pesos em fp32 e roda
+    os matmuls sob torch.autocast (CUDA ou CPU com AMX/AVX512-BF16).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 0, device: str = "auto", dtype: str = "auto"):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        if dtype == "auto":
+            dtype = "float16" if device.startswith("cuda") else "float32"
+        if dtype not in ("float32", "float16", "bfloat16"):
+            raise RuntimeError(f"EMBEDDING_DTYPE invalido: {dtype}")
+        self._torch = torch
+        self.device = device
+        self.dtype = dtype
+        self.model = SentenceTransformer(model_name, device=device)
+        if dtype == "float16":
+            self.model.half()
+        self.batch_size = batch_size or (256 if device.startswith("cuda") else 64)
+
+    def _encode(self, texts, batch_size: int) -> np.ndarray:
+        torch = self._torch
+        autocast = torch.autocast(
+            self.device.split(":")[0], dtype=torch.bfloat16, enabled=self.dtype == "bfloat16"
+        )
+        with torch.inference_mode(), autocast:
+            return self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(list(texts), self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode(text, 1).tolist()
+
+
+def embedding_model_id() -> str:
+    """
+    "<provedor>:<modelo>" dos embeddings configurados: namespace do cache de
+    embeddings e metadado dos chunks (vetores de modelos diferentes não se
+    misturam).
+    """
+    if EMBEDDING_PROVIDER == "azure":
+        return f"azure:{AZURE_OPENAI_EMBEDDING_DEPLOYMENT}"
+    return f"{EMBEDDING_PROVIDER}:{EMBEDDING_MODEL}"
 
 
 def get_embeddings():
     global _embeddings_singleton
-    if _embeddings_singleton is None:
+    if _embeddings_singleton is not None:
+        return _embeddings_singleton
+    with _singletons_lock:
+        if _embeddings_singleton is not None:
+            return _embeddings_singleton
         if EMBEDDING_PROVIDER == "azure":
             if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY and AZURE_OPENAI_EMBEDDING_DEPLOYMENT):
                 raise RuntimeError("Config Azure OpenAI incompleta para embeddings.")
-            _embeddings_singleton = AzureOpenAIEmbeddings(
+            # import tardio: só o provedor configurado é carregado no processo
+            from langchain_openai import AzureOpenAIEmbeddings
+
+            embeddings = AzureOpenAIEmbeddings(
                 azure_endpoint=AZURE_OPENAI_ENDPOINT,
                 api_key=AZURE_OPENAI_API_KEY,
                 api_version=AZURE_OPENAI_API_VERSION,
                 azure_deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
             )
         elif EMBEDDING_PROVIDER == "huggingface":
-            _embeddings_singleton = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_MODEL,
-                cache_folder=None,
+            embeddings = BatchEncoder(
+                EMBEDDING_MODEL,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                device=EMBEDDING_DEVICE,
+                dtype=EMBEDDING_DTYPE,
             )
         else:
             raise RuntimeError(f"EMBEDDING_PROVIDER invalido: {EMBEDDING_PROVIDER}")
+        if EMBED_CACHE_PATH:
+            embeddings = CachedEmbeddings(embeddings, EMBED_CACHE_PATH, namespace=embedding_model_id())
+        _embeddings_singleton = embeddings
     return _embeddings_singleton
 
 
+def embed_queries(texts: List[str], emb=None) -> List[List[float]]:
+    """
+    Embeddings de várias consultas numa única chamada ao modelo, sem gravar
+    as perguntas no cache SQLite (CachedEmbeddings.embed_queries), que é só
+    para chunks de documentos.
+    """
+    emb = get_embeddings() if emb is None else emb
+    embed = getattr(emb, "embed_queries", None)
+    return embed(list(texts)) if embed is not None else emb.embed_documents(list(texts))
+
+
+@lru_cache(maxsize=1024)
+def _embed_query_cached(text: str) -> Tuple[float, ...]:
+    """
+    Embedding de consulta com cache exato em memória (tupla, para ser
+    hashable): retries e perguntas repetidas não pagam outro forward do
+    modelo. Não depende do índice, então sobrevive a reindexações.
+    """
+    return tuple(get_embeddings().embed_query(text))
+
+
+def _normalize_rows(vectors) -> np.ndarray:
+    """Matriz float32 contígua [N, D] com cada linha de norma 1 (linhas nulas ficam nulas)."""
+    mat = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return np.ascontiguousarray(mat / norms)
+
+
+def _where_predicate(where: Optional[Dict[str, Any]]):
+    """
+    Filtro de metadados no formato do Chroma, compilado uma vez para testar
+    cada entrada: {"campo": valor}, {"campo": {"$eq"|"$ne"|"$in"|"$nin": v}}
+    e {"$and"|"$or": [filtros]}. Listas de $in/$nin viram sets.
+    """
+    if not where:
+        return lambda metadata: True
+    tests = []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            preds = [_where_predicate(w) for w in cond]
+            combine = all if key == "$and" else any
+            tests.append(lambda m, preds=preds, combine=combine: combine(p(m) for p in preds))
+            continue
+        op, val = next(iter(cond.items())) if isinstance(cond, dict) else ("$eq", cond)
+        if op in ("$in", "$nin"):
+            val = frozenset(val)
+        check = {
+            "$eq": lambda v, val: v == val,
+            "$ne": lambda v, val: v != val,
+            "$in": lambda v, val: v in val,
+            "$nin": lambda v, val: v not in val,
+        }.get(op)
+        if check is None:
+            raise ValueError(f"Operador de filtro não suportado: {op}")
+        tests.append(lambda m, key=key, val=val, check=check: check(m.get(key), val))
+    return lambda metadata: all(t(metadata) for t in tests)
+
+
+def _entry_document(entry: Dict[str, Any]) -> Document:
+    """Document de uma entrada persistida; as buscas só chamam isto para os hits do top-k."""
+    return Document(page_content=entry["page_content"], metadata=entry["metadata"])
+
+
+def _top_k_hits(data, row_idx, row_scores, min_score: Optional[float] = None) -> List[Tuple[Document, float]]:
+    """
+    Hits de uma consulta a partir do seu top-k (índices e scores em ordem
+    decrescente): para no primeiro score abaixo de `min_score`, sem criar
+    Documents para ele nem para os seguintes. Índices negativos (faiss sem
+    vizinho) são pulados.
+    """
+    hits = []
+    for i, score in zip(row_idx.tolist(), row_scores.tolist()):
+        if min_score is not None and score < min_score:
+            break
+        if i >= 0:
+            hits.append((_entry_document(data[i]), score))
+    return hits
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k de cada linha de `scores` [Q, N]: (scores [Q, k], índices [Q, k]) em
+    ordem decrescente. Um único argpartition (O(N) por linha) e depois um
+    argsort só dos k escolhidos, para todas as consultas de uma vez.
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0), dtype=np.intp)
+        return scores[:, :0], empty
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    top = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices dos k maiores scores de um vetor [N], em ordem decrescente."""
+    return _top_k_rows(scores[None, :], k)[1][0]
+
+
+def _knn_inner_product(matrix: np.ndarray, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca exata dos k maiores produtos internos de cada consulta: (scores
+    [Q, k], índices [Q, k]) em ordem decrescente. Com faiss usa faiss.knn
+    (kernels SIMD/BLAS e heap em C++) direto sobre `matrix`, sem copiar para
+    um índice; senão pontua com simsimd.cdist (AVX2/AVX-512/NEON escolhido em
+    tempo de execução), com o kernel Numba dot_scores ou com matmul do numpy,
+    e seleciona com _top_k_rows.
+    """
+    k = min(k, matrix.shape[0])
+    if faiss is not None:
+        return faiss.knn(queries, matrix, k, metric=faiss.METRIC_INNER_PRODUCT)
+    if simsimd is not None:
+        return _top_k_rows(np.asarray(simsimd.cdist(queries, matrix, metric="dot")), k)
+    if NUMBA_AVAILABLE:
+        return _top_k_rows(dot_scores(matrix, queries), k)
+    return _top_k_rows(queries @ matrix.T, k)
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def dot_scores(matrix, queries):
+    """
+    Produto interno [Q, N] de consultas fp32 com as linhas (já unitárias) de
+    `matrix`: prange sobre as linhas e o laço interno vetorizado pelo LLVM.
+    """
+    n, d = matrix.shape
+    nq = queries.shape[0]
+    out = np.empty((nq, n), dtype=np.float32)
+    for i in prange(n):
+        for j in range(nq):
+            acc = np.float32(0.0)
+            for t in range(d):
+                acc += matrix[i, t] * queries[j, t]
+            out[j, i] = acc
+    return out
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def int8_scores(codes, scale, bias, queries, query_sums):
+    """
+    Scores [Q, N] de consultas fp32 contra códigos int8 numa única passada
+    por linha: converte, multiplica e acumula cada byte sem materializar a
+    linha em fp32; depois aplica scale * (c·q) + bias * Σq.
+    """
+    n, d = codes.shape
+    nq = queries.shape[0]
+    out = np.empty((nq, n), dtype=np.float32)
+    for i in prange(n):
+        for j in range(nq):
+            acc = np.float32(0.0)
+            for t in range(d):
+                acc += np.float32(codes[i, t]) * queries[j, t]
+            out[j, i] = scale[i] * acc + bias[i] * query_sums[j]
+    return out
+
+
 class SimpleVectorStore:
+    """
+    Vectorstore local: texto/metadados em JSON (msgspec) e cada coluna de
+    embedding num sidecar .npy ao lado, carregado via mmap. Cada persist()
+    grava uma geração nova de sidecars (<coluna>.<geração>.npy) e só então
+    troca o JSON, que lista os sidecars da geração: o JSON é o ponto de
+    commit, então uma queda no meio da gravação mantém o estado anterior.
+
+    Em memória o corpus fica em layout SoA: `_data` guarda só texto/metadados
+    e `_columns` guarda os embeddings em arrays contíguos, uma linha por item
+    de `_data`. precision="float32" mantém a matriz [N, D] normalizada, e o
+    cosseno vira um único matmul; precision="int8" guarda códigos int8 com
+    min/max por linha (4x menor) e pontua a consulta fp32 direto sobre os
+    códigos (kernel Numba int8_scores, ou numpy em blocos de INT8_BLOCK_ROWS
+    linhas sem Numba).
+    """
     FILENAME = "documents.json"
+    PRECISIONS = {"float32", "int8"}
+    # Linhas int8 convertidas para fp32 por vez na busca (bloco cabe no cache)
+    INT8_BLOCK_ROWS = 2048
+    # Chave que identifica o formato de cada precisão numa entrada persistida
+    _FORMAT_KEYS = {"float32": "embedding", "int8": "embedding_int8", "binary": "embedding_bits"}
+    # Colunas de cada precisão (uma por sidecar <coluna>.npy)
+    _COLUMNS = {
+        "float32": ("embedding",),
+        "int8": ("embedding_int8", "embedding_offset", "embedding_scale"),
+        "binary": ("embedding", "embedding_bits"),
+    }
+    _EMBEDDING_KEYS = (
+        "embedding", "embedding_int8", "embedding_offset",
+        "embedding_scale", "embedding_norm", "embedding_bits",
+    )
+    # <coluna>.npy (formato antigo, sem geração) ou <coluna>.<geração>.npy
+    _SIDECAR_RE = re.compile(r"^(?P<name>\w+?)(?:\.\d+)?\.npy$")
 
-    def __init__(self, persist_directory: str | os.PathLike):
+    def __init__(self, persist_directory: str | os.PathLike, precision: str = EMBEDDING_PRECISION):
+        if precision not in self.PRECISIONS:
+            raise RuntimeError(f"EMBEDDING_PRECISION invalido: {precision}")
         self.persist_directory = str(persist_directory)
         os.makedirs(self.persist_directory, exist_ok=True)
         self.filepath = os.path.join(self.persist_directory, self.FILENAME)
+        self.precision = precision
         self._emb = get_embeddings()
         self._data: List[Dict[str, Any]] = []
+        self._columns: Dict[str, np.ndarray] = {}
+        # geração gravada no JSON atual (0: nada gravado ou formato antigo)
+        self._generation = 0
+        # add/delete trocam _data e _columns juntos sob este lock e as buscas
+        # leem os dois via _snapshot(): uma busca concorrente com a ingestão
+        # nunca vê linhas desalinhadas
+        self._lock = threading.Lock()
+        # há mudanças em memória ainda não gravadas por persist()
+        self._dirty = False
+        # (coluna embedding_scale de origem, bias int8 derivado dela)
+        self._int8_bias_cache = None
         self._load()
 
+    def _snapshot(self) -> Tuple[List[Dict[str, Any]], Dict[str, np.ndarray]]:
+        """(_data, _columns) de um mesmo estado do store."""
+        with self._lock:
+            return self._data, self._columns
+
+    def _load_sidecars(self, files: Dict[str, str], n_rows: int) -> Dict[str, np.ndarray]:
+        """Sidecars .npy presentes e alinhados com o JSON, mapeados em memória (somente leitura)."""
+        sidecars = {}
+        for name, filename in files.items():
+            path = os.path.join(self.persist_directory, filename)
+            if name in self._EMBEDDING_KEYS and os.path.exists(path):
+                try:
+                    column = np.load(path, mmap_mode="r")
+                except Exception:
+                    continue
+                if column.shape[0] == n_rows:
+                    sidecars[name] = column
+        return sidecars
+
     def _load(self):
+        try:
+            self._load_state()
+        except Exception:
+            # JSON corrompido ou de um formato que não sabemos converter: sobe
+            # vazio (como sem arquivo) em vez de derrubar a API
+            logger.exception("Falha ao carregar %s; vectorstore iniciado vazio.", self.filepath)
+            self._data, self._columns, self._generation, self._dirty = [], {}, 0, False
+
+    def _load_state(self):
+        entries: List[Dict[str, Any]] = []
+        files: Dict[str, str] = {}
         if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, "r", encoding="utf-8") as f:
-                    self._data = json.load(f)
-            except Exception:
-                self._data = []
+            with open(self.filepath, "rb") as f:
+                state = msgspec.json.decode(f.read())
+            if isinstance(state, list):
+                # formato antigo: só a lista de entradas, sidecars sem geração
+                entries = state
+                files = {name: f"{name}.npy" for name in self._EMBEDDING_KEYS}
+            else:
+                entries, files = state["entries"], state["columns"]
+                self._generation = state["generation"]
+
+        self._data = [{"page_content": e["page_content"], "metadata": e["metadata"]} for e in entries]
+        sidecars = self._load_sidecars(files, len(entries)) if entries else {}
+        # só o formato atual (sidecars da precisão configurada) dispensa regravar
+        self._dirty = bool(entries)
+        if not entries:
+            self._columns = {}
+        elif all(name in sidecars for name in self._COLUMNS[self.precision]):
+            self._columns = {name: sidecars[name] for name in self._COLUMNS[self.precision]}
+            self._dirty = False
+        elif all(self._FORMAT_KEYS[self.precision] in e for e in entries):
+            # formato antigo, com os embeddings dentro do JSON
+            self._columns = self._columns_from_entries(entries)
+        elif "embedding" in sidecars:
+            # persistido com outra precisão: reconstrói o fp32 e recodifica
+            self._columns = self._encode(sidecars["embedding"])
+        elif "embedding_int8" in sidecars:
+            self._columns = self._encode(dequantize_int8(
+                sidecars["embedding_int8"], sidecars["embedding_offset"], sidecars["embedding_scale"]
+            ))
         else:
-            self._data = []
+            self._columns = self._encode([self._entry_vector(e) for e in entries])
 
     def _save(self):
-        with open(self.filepath, "w", encoding="utf-8") as f:
-            json.dump(self._data, f, ensure_ascii=False)
+        """
+        Grava as colunas em sidecars de uma geração nova (arquivos que nenhum
+        JSON referencia ainda) e depois troca o JSON via os.replace. Os
+        sidecars antigos saem por último, depois que as colunas em memória
+        passam a mapear os novos.
+        """
+        generation = self._generation + 1
+        files = {name: f"{name}.{generation}.npy" for name in self._columns}
+        for name, filename in files.items():
+            with open(os.path.join(self.persist_directory, filename), "wb") as f:
+                np.save(f, np.ascontiguousarray(self._columns[name]))
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(msgspec.json.encode({"generation": generation, "columns": files, "entries": self._data}))
+        os.replace(tmp_path, self.filepath)
+        self._generation = generation
+
+        # solta os mmaps da geração anterior: no Windows um arquivo mapeado
+        # não pode ser removido
+        mapped = self._load_sidecars(files, len(self._data))
+        if len(mapped) == len(files):
+            with self._lock:
+                self._columns = mapped
+            self._int8_bias_cache = None
+        self._remove_stale_sidecars(files)
+
+    def _remove_stale_sidecars(self, current: Dict[str, str]):
+        """Remove sidecars que o JSON atual não referencia (gerações antigas, formato antigo)."""
+        keep = set(current.values())
+        for filename in os.listdir(self.persist_directory):
+            m = self._SIDECAR_RE.match(filename)
+            if filename in keep or not m or m["name"] not in self._EMBEDDING_KEYS:
+                continue
+            try:
+                os.remove(os.path.join(self.persist_directory, filename))
+            except OSError:
+                # ainda mapeado em outro lugar: sai na próxima gravação
+                pass
+
+    def _encode(self, vectors) -> Dict[str, np.ndarray]:
+        """Colunas de embedding para `vectors` conforme a precisão configurada."""
+        if self.precision == "int8":
+            codes, offsets, scales = quantize_int8(_normalize_rows(vectors))
+            # a norma do vetor dequantizado entra em scale/offset: a busca
+            # vira produto escalar puro com a consulta unitária
+            norms = np.linalg.norm(dequantize_int8(codes, offsets, scales), axis=1)
+            norms[norms == 0.0] = 1.0
+            return {
+                "embedding_int8": codes,
+                "embedding_offset": (offsets / norms).astype(np.float32),
+                "embedding_scale": (scales / norms).astype(np.float32),
+            }
+        return {"embedding": _normalize_rows(vectors)}
+
+    def _columns_from_entries(self, entries: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Colunas lidas de entradas já persistidas na precisão atual."""
+        if self.precision == "int8":
+            # entradas antigas guardam a norma à parte: dobra em scale/offset
+            norms = np.array([e.get("embedding_norm", 1.0) for e in entries], dtype=np.float32)
+            norms[norms == 0.0] = 1.0
+            return {
+                "embedding_int8": np.array([e["embedding_int8"] for e in entries], dtype=np.int8),
+                "embedding_offset": np.array([e["embedding_offset"] for e in entries], dtype=np.float32) / norms,
+                "embedding_scale": np.array([e["embedding_scale"] for e in entries], dtype=np.float32) / norms,
+            }
+        return {"embedding": _normalize_rows([e["embedding"] for e in entries])}
+
+    @staticmethod
+    def _entry_vector(entry: Dict[str, Any]) -> List[float]:
+        """Embedding fp32 de uma entrada, qualquer que seja a precisão persistida."""
+        if "embedding" in entry:
+            return entry["embedding"]
+        codes = np.array([entry["embedding_int8"]], dtype=np.int8)
+        offsets = np.array([entry["embedding_offset"]], dtype=np.float32)
+        scales = np.array([entry["embedding_scale"]], dtype=np.float32)
+        return dequantize_int8(codes, offsets, scales)[0].tolist()
 
     def delete(self, filter: Dict[str, Any] = None, where: Dict[str, Any] = None):
         filtro = filter or where
-        if not filtro:
+        if not filtro or not self._data:
             return
-        key, val = next(iter(filtro.items()))
-        self._data = [d for d in self._data if d.get("metadata", {}).get(key) != val]
-        self._save()
+        matches = _where_predicate(filtro)
+        keep = np.array([not matches(d.get("metadata", {})) for d in self._data], dtype=bool)
+        if keep.all():
+            # nada a remover: não copia as colunas (que podem estar em mmap)
+            return
+        data = [d for d, k in zip(self._data, keep) if k]
+        columns = {name: column[keep] for name, column in self._columns.items()}
+        with self._lock:
+            self._data, self._columns = data, columns
+        self._dirty = True
+
+    def get(self, where: Dict[str, Any] = None) -> Dict[str, List]:
+        """Entradas cujo metadado casa com `where` (formato do Chroma: documents/metadatas)."""
+        matches = _where_predicate(where)
+        hits = [d for d in self._data if matches(d.get("metadata", {}))]
+        return {
+            "documents": [d["page_content"] for d in hits],
+            "metadatas": [d.get("metadata", {}) for d in hits],
+        }
 
     def add_documents(self, documents: List[Document]) -> List[str]:
         if not documents:
             return []
         texts = [d.page_content for d in documents]
-        vectors = self._emb.embed_documents(texts)
+        new_columns = self._encode(self._emb.embed_documents(texts))
+
+        data = self._data + [{"page_content": d.page_content, "metadata": d.metadata or {}} for d in documents]
+        if self._columns:
+            columns = {
+                name: np.concatenate([column, new_columns[name]])
+                for name, column in self._columns.items()
+            }
+        else:
+            columns = new_columns
+        with self._lock:
+            self._data, self._columns = data, columns
+        self._dirty = True
+        return [(d.metadata or {}).get("doc_id", "unknown") for d in documents]
+
+    def persist(self):
+        """
+        Grava o estado atual em disco, se houve mudanças desde a última
+        gravação; add_documents/delete só marcam o store como sujo, então um
+        lote de ingestão inteiro custa uma única escrita.
+        """
+        if self._dirty:
+            self._save()
+            self._dirty = False
+
+    def _int8_bias(self, columns: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        offset + 128 * scale por linha: não depende da consulta, então só é
+        recalculado quando as colunas são trocadas (add/delete/load criam
+        arrays novos).
+        """
+        columns = self._columns if columns is None else columns
+        scale = columns["embedding_scale"]
+        cached = self._int8_bias_cache
+        if cached is None or cached[0] is not scale:
+            cached = (scale, (columns["embedding_offset"] + 128.0 * scale).astype(np.float32))
+            self._int8_bias_cache = cached
+        return cached[1]
+
+    def _scores(self, queries, columns: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Cosseno de cada consulta (linhas de `queries`, [Q, D] ou [D]) com
+        todas as linhas do corpus, numa única varredura: matriz [Q, N].
+        """
+        q = _normalize_rows(queries)
+        cols = self._columns if columns is None else columns
+        if self.precision == "int8":
+            # x ≈ (c + 128) * scale + offset, já unitário
+            #   =>  x·q = scale * (c·q) + (offset + 128 * scale) * Σq
+            codes, scale = cols["embedding_int8"], cols["embedding_scale"]
+            bias = self._int8_bias(cols)
+            if NUMBA_AVAILABLE:
+                return int8_scores(codes, scale, bias, q, q.sum(axis=1))
+            dots = np.empty((q.shape[0], codes.shape[0]), dtype=np.float32)
+            # só um bloco de linhas é convertido para fp32 de cada vez: a
+            # varredura lê 1 byte/dimensão em vez de materializar [N, D] fp32
+            for start in range(0, codes.shape[0], self.INT8_BLOCK_ROWS):
+                block = slice(start, start + self.INT8_BLOCK_ROWS)
+                dots[:, block] = q @ codes[block].astype(np.float32).T
+            return dots * scale + np.outer(q.sum(axis=1), bias)
+        return q @ cols["embedding"].T
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 5, min_score: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
+        if not self._data:
+            return []
+        return self.similarity_search_with_score_by_vector(_embed_query_cached(query), k=k, min_score=min_score)
+
+    def similarity_search_with_score_by_vector(
+        self, q_vec: List[float], k: int = 5, min_score: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
+        if not self._data:
+            return []
+        return self.similarity_search_batch_by_vector([q_vec], k=k, min_score=min_score)[0]
+
+    def similarity_search_batch(
+        self, queries: List[str], k: int = 5, min_score: Optional[float] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Busca várias consultas de uma vez: um único encode em lote e uma única multiplicação de matrizes."""
+        if not queries:
+            return []
+        if not self._data:
+            return [[] for _ in queries]
+        return self.similarity_search_batch_by_vector(
+            embed_queries(queries, self._emb), k=k, min_score=min_score
+        )
+
+    def similarity_search_batch_by_vector(
+        self, q_vecs: List[List[float]], k: int = 5, min_score: Optional[float] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        data, columns = self._snapshot()
+        if not data or k <= 0:
+            return [[] for _ in q_vecs]
+        if self.precision == "float32":
+            scores, idx = _knn_inner_product(columns["embedding"], _normalize_rows(q_vecs), k)
+        else:
+            scores, idx = _top_k_rows(self._scores(q_vecs, columns), k)
+        return [
+            _top_k_hits(data, row_idx, row_scores, min_score)
+            for row_idx, row_scores in zip(idx, scores)
+        ]
+
+
+# Número de bits 1 de cada byte, para popcount vetorizado
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class BinaryVectorStore(SimpleVectorStore):
+    """
+    Variante com quantização binária (1 bit/dimensão, np.packbits(emb > 0)).
+
+    A busca ordena o corpus por distância de Hamming (popcount do XOR) e
+    reordena os OVERSAMPLING * k melhores candidatos pelo cosseno fp32, que
+    continua persistido em "embedding".
+    """
+    PRECISIONS = {"binary"}
+    OVERSAMPLING = 4
+
+    def __init__(self, persist_directory: str | os.PathLike):
+        super().__init__(persist_directory, precision="binary")
+
+    def _encode(self, vectors) -> Dict[str, np.ndarray]:
+        mat = _normalize_rows(vectors)
+        return {"embedding": mat, "embedding_bits": np.packbits(mat > 0, axis=1)}
+
+    def _columns_from_entries(self, entries: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        packed = bytes.fromhex("".join(e["embedding_bits"] for e in entries))
+        return {
+            "embedding": _normalize_rows([e["embedding"] for e in entries]),
+            "embedding_bits": np.frombuffer(packed, dtype=np.uint8).reshape(len(entries), -1),
+        }
+
+    def similarity_search_with_score_by_vector(
+        self, q_vec: List[float], k: int = 5, min_score: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
+        data, columns = self._snapshot()
+        if not data or k <= 0:
+            return []
+        q = _normalize_rows(q_vec)[0]
+        bits = columns["embedding_bits"]
+        hamming = _POPCOUNT[np.bitwise_xor(bits, np.packbits(q > 0))].sum(axis=1)
+
+        n_cand = min(len(data), self.OVERSAMPLING * k)
+        cand = np.argpartition(hamming, n_cand - 1)[:n_cand]
+        sims = columns["embedding"][cand] @ q
+
+        top = _top_k_indices(sims, k)
+        return _top_k_hits(data, cand[top], sims[top], min_score)
+
+    def similarity_search_batch_by_vector(
+        self, q_vecs: List[List[float]], k: int = 5, min_score: Optional[float] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        # a pré-seleção por Hamming é por consulta
+        return [self.similarity_search_with_score_by_vector(q, k=k, min_score=min_score) for q in q_vecs]
+
+
+class FaissVectorStore:
+    """
+    Vectorstore sobre um índice Faiss (produto interno de vetores normalizados,
+    ou seja, cosseno), com a mesma API do SimpleVectorStore.
+
+    Enquanto o corpus tem menos de `train_size` vetores o índice é exato
+    (IDMap2,Flat); ao atingir esse tamanho ele é treinado e reconstruído com
+    `index_factory` (ex.: IVF4096,PQ32), que já aceita ids próprios. Os ids
+    do índice apontam para o texto/metadados guardados em FILENAME.
+
+    Como no SimpleVectorStore, cada persist() grava o índice num arquivo de
+    geração nova (faiss.<geração>.index) e só então troca o JSON, que aponta
+    para ele: uma queda no meio mantém o par anterior consistente.
+    """
+    FILENAME = "faiss_documents.json"
+    # índice do formato antigo, sem geração
+    INDEX_FILENAME = "faiss.index"
+    _INDEX_RE = re.compile(r"^faiss(?:\.\d+)?\.index$")
+
+    def __init__(
+        self,
+        persist_directory: str | os.PathLike,
+        index_factory: str = FAISS_INDEX_FACTORY,
+        train_size: int = FAISS_TRAIN_SIZE,
+        nprobe: int = FAISS_NPROBE,
+        ef_search: int = FAISS_EF_SEARCH,
+    ):
+        if faiss is None:
+            raise RuntimeError("VECTORSTORE=faiss requer o pacote faiss-cpu.")
+        self._faiss = faiss
+        self.persist_directory = str(persist_directory)
+        os.makedirs(self.persist_directory, exist_ok=True)
+        self.filepath = os.path.join(self.persist_directory, self.FILENAME)
+        self.index_factory = index_factory
+        self.train_size = train_size
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self._emb = get_embeddings()
+        self._data: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._index = None
+        self._trained = False
+        self._dirty = False
+        self._generation = 0
+        # erro da carga: o store sobe vazio, mas não grava por cima dos
+        # arquivos que não conseguiu ler
+        self._load_error: Optional[str] = None
+        # índice e _data mudam juntos: add/delete e a busca seguram o lock
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        self._data, self._next_id, self._index, self._trained = {}, 0, None, False
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, "rb") as f:
+                state = msgspec.json.decode(f.read())
+            data = {int(i): e for i, e in state["entries"].items()}
+            # formato antigo: sem "index_file", índice em INDEX_FILENAME
+            index_file = state.get("index_file", self.INDEX_FILENAME if data else None)
+            index = None
+            if index_file:
+                index = self._faiss.read_index(os.path.join(self.persist_directory, index_file))
+        except Exception as e:
+            logger.exception("Falha ao carregar %s; vectorstore iniciado vazio e sem gravação.", self.filepath)
+            self._load_error = str(e)
+            return
+        self._data, self._index = data, index
+        self._next_id, self._trained = state["next_id"], state["trained"]
+        self._generation = state.get("generation", 0)
+        if self._index is not None:
+            self._apply_search_params()
+
+    def _save(self):
+        """
+        Grava o índice em faiss.<geração>.index e depois troca o JSON via
+        os.replace (ponto de commit); os índices antigos saem por último.
+        """
+        if self._load_error is not None:
+            raise RuntimeError(
+                f"{self.filepath} não pôde ser carregado ({self._load_error}); "
+                "corrija ou remova os arquivos antes de gravar o vectorstore."
+            )
+        generation = self._generation + 1
+        index_file = f"faiss.{generation}.index" if self._index is not None else None
+        if index_file:
+            self._faiss.write_index(self._index, os.path.join(self.persist_directory, index_file))
+        state = {
+            "generation": generation,
+            "index_file": index_file,
+            "next_id": self._next_id,
+            "trained": self._trained,
+            "entries": self._data,  # ids int viram chaves str, relidas com int()
+        }
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(msgspec.json.encode(state))
+        os.replace(tmp_path, self.filepath)
+        self._generation = generation
+
+        for filename in os.listdir(self.persist_directory):
+            if filename != index_file and self._INDEX_RE.match(filename):
+                try:
+                    os.remove(os.path.join(self.persist_directory, filename))
+                except OSError:
+                    pass  # sai na próxima gravação
+
+    def _apply_search_params(self):
+        ps = self._faiss.ParameterSpace()
+        for name, value in (("nprobe", self.nprobe), ("quantizer_efSearch", self.ef_search)):
+            try:
+                ps.set_index_parameter(self._index, name, value)
+            except RuntimeError:
+                pass  # parâmetro não se aplica a este tipo de índice
+
+    def _maybe_train(self):
+        """Troca o índice exato pelo index_factory treinado quando há dados suficientes."""
+        if self._trained or self._index.ntotal < self.train_size:
+            return
+        ids = self._faiss.vector_to_array(self._index.id_map).astype(np.int64)
+        vectors = self._index.index.reconstruct_n(0, self._index.ntotal)
+        trained = self._faiss.index_factory(
+            vectors.shape[1], self.index_factory, self._faiss.METRIC_INNER_PRODUCT
+        )
+        trained.train(vectors)
+        trained.add_with_ids(vectors, ids)
+        self._index = trained
+        self._trained = True
+        self._apply_search_params()
+
+    def delete(self, filter: Dict[str, Any] = None, where: Dict[str, Any] = None):
+        filtro = filter or where
+        if not filtro or self._index is None:
+            return
+        matches = _where_predicate(filtro)
+        ids = [i for i, e in self._data.items() if matches(e.get("metadata", {}))]
+        if not ids:
+            return
+        with self._lock:
+            self._index.remove_ids(np.array(ids, dtype=np.int64))
+            for i in ids:
+                del self._data[i]
+        self._dirty = True
 
-        ids = []
-        for d, vec in zip(documents, vectors):
-            doc_id = (d.metadata or {}).get("doc_id", "unknown")
-            self._data.append({
-                "page_content": d.page_content,
-                "metadata": d.metadata or {},
-                "embedding": vec,
-            })
-            ids.append(doc_id)
+    def get(self, where: Dict[str, Any] = None) -> Dict[str, List]:
+        """Entradas cujo metadado casa com `where` (formato do Chroma: documents/metadatas)."""
+        matches = _where_predicate(where)
+        hits = [e for e in self._data.values() if matches(e.get("metadata", {}))]
+        return {
+            "documents": [e["page_content"] for e in hits],
+            "metadatas": [e.get("metadata", {}) for e in hits],
+        }
 
-        self._save()
-        return ids
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        if not documents:
+            return []
+        vectors = _normalize_rows(self._emb.embed_documents([d.page_content for d in documents]))
+        with self._lock:
+            if self._index is None:
+                self._index = self._faiss.index_factory(
+                    vectors.shape[1], "IDMap2,Flat", self._faiss.METRIC_INNER_PRODUCT
+                )
+
+            ids = np.arange(self._next_id, self._next_id + len(documents), dtype=np.int64)
+            self._next_id += len(documents)
+            for i, d in zip(ids, documents):
+                self._data[int(i)] = {"page_content": d.page_content, "metadata": d.metadata or {}}
+            self._index.add_with_ids(vectors, ids)
+            self._maybe_train()
+        self._dirty = True
+        return [(d.metadata or {}).get("doc_id", "unknown") for d in documents]
 
     def persist(self):
-        pass
+        """Grava JSON e índice só se houve mudanças desde a última gravação."""
+        if self._dirty:
+            self._save()
+            self._dirty = False
 
-    @staticmethod
-    def _cosine_similarity(a: List[float], b: List[float]) -> float:
-        dot = sum(x * y for x, y in zip(a, b))
-        na = math.sqrt(sum(x * x for x in a))
-        nb = math.sqrt(sum(y * y for y in b))
-        if na == 0.0 or nb == 0.0:
-            return 0.0
-        return dot / (na * nb)
-
-    def similarity_search_with_score(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+    def similarity_search_with_score(
+        self, query: str, k: int = 5, min_score: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
         if not self._data:
             return []
-        q_vec = self._emb.embed_query(query)
-        scored: List[Tuple[Document, float]] = []
-        for entry in self._data:
-            sim = self._cosine_similarity(q_vec, entry["embedding"])
-            doc = Document(page_content=entry["page_content"], metadata=entry["metadata"])
-            scored.append((doc, sim))
-        scored.sort(key=lambda t: t[1], reverse=True)
-        return scored[:k]
+        return self.similarity_search_with_score_by_vector(_embed_query_cached(query), k=k, min_score=min_score)
+
+    def similarity_search_with_score_by_vector(
+        self, q_vec: List[float], k: int = 5, min_score: Optional[float] = None
+    ) -> List[Tuple[Document, float]]:
+        if not self._data or k <= 0:
+            return []
+        return self.similarity_search_batch_by_vector([q_vec], k=k, min_score=min_score)[0]
+
+    def similarity_search_batch(
+        self, queries: List[str], k: int = 5, min_score: Optional[float] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        if not queries:
+            return []
+        if not self._data:
+            return [[] for _ in queries]
+        return self.similarity_search_batch_by_vector(
+            embed_queries(queries, self._emb), k=k, min_score=min_score
+        )
+
+    def similarity_search_batch_by_vector(
+        self, q_vecs: List[List[float]], k: int = 5, min_score: Optional[float] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        if not self._data or k <= 0:
+            return [[] for _ in q_vecs]
+        with self._lock:
+            scores, ids = self._index.search(_normalize_rows(q_vecs), min(k, len(self._data)))
+            return [
+                _top_k_hits(self._data, row_ids, row_scores, min_score)
+                for row_ids, row_scores in zip(ids, scores)
+            ]
 
 
 def get_vectorstore():
     global _store_singleton
-    if _store_singleton is None:
-        _store_singleton = SimpleVectorStore(CHROMA_PERSIST_DIR)
+    if _store_singleton is not None:
+        return _store_singleton
+    with _singletons_lock:
+        if _store_singleton is None:
+            if VECTORSTORE == "faiss":
+                _store_singleton = FaissVectorStore(CHROMA_PERSIST_DIR)
+            elif VECTORSTORE != "simple":
+                raise RuntimeError(f"VECTORSTORE invalido: {VECTORSTORE}")
+            elif EMBEDDING_PRECISION == "binary":
+                _store_singleton = BinaryVectorStore(CHROMA_PERSIST_DIR)
+            else:
+                _store_singleton = SimpleVectorStore(CHROMA_PERSIST_DIR)
     return _store_singleton
+
+
+def vectorstore_loaded() -> bool:
+    return _store_singleton is not None
+
+
+def preload_vectorstore() -> threading.Thread:
+    """
+    Carrega modelo de embeddings e vectorstore numa thread daemon. Perguntas
+    que chegam antes do fim esperam no lock de get_vectorstore(); falhas só
+    são registradas e voltam a ocorrer (com o erro) na primeira pergunta.
+    """
+    def _load():
+        try:
+            get_vectorstore()
+        except Exception:
+            logger.exception("Falha ao pré-carregar o vectorstore")
+
+    thread = threading.Thread(target=_load, name="vectorstore-preload", daemon=True)
+    thread.start()
+    return thread
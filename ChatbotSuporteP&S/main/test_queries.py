@@ -42,7 +42,7 @@ def hf_answer(query, context, model="mistralai/Mistral-7B-Instruct-v0.2", token=
 def rag_answer(query, k=3):
     vectorstore = get_vectorstore()
     results = vectorstore.similarity_search_with_score(query, k=k)
-    context = "\n\n".join([doc.page_content for doc, score in results])
+    context = "\n\n".join(doc.page_content for doc, _ in results)
     # Tenta Ollama
     resposta = ollama_answer(query, context)
     if resposta:
@@ -61,7 +61,7 @@ if __name__ == "__main__":
     try:
         vectorstore = get_vectorstore()
         results = vectorstore.similarity_search_with_score(query, k=3)
-        context = "\n\n".join([doc.page_content for doc, score in results])
+        context = "\n\n".join(doc.page_content for doc, _ in results)
         print("\n[DEBUG] Contexto enviado ao LLM:\n", context[:500], "...\n")
         resposta = rag_answer(query, k=3)
         print("\nResposta curta:", resposta)
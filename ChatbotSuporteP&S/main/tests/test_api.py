@@ -1,9 +1,143 @@
 import asyncio
+import io
+import json
+from pathlib import Path
 
-from src.api.main import health
+import pytest
+from fastapi import BackgroundTasks, HTTPException, Request, UploadFile
+
+import src.api.main as api_main
+from src.api.main import health, ingest_status, upload_document
+from src.ingestion.loaders import compute_checksum
+
+
+def _json_request(body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
 
 
 def test_health_endpoint():
     body = asyncio.run(health())
     assert body["status"] == "healthy"
     assert body["service"] == "Chatbot Suporte P&S"
+
+
+def test_upload_streams_file_and_ingests_in_background(monkeypatch, tmp_path):
+    content = b"conteudo do manual" * 1000
+    calls = {}
+
+    def fake_ingest_file(path, root, checksum=None):
+        calls["path"] = path
+        calls["checksum"] = checksum
+        return True
+
+    monkeypatch.setattr(api_main, "RAW_DATA_DIR", tmp_path)
+    monkeypatch.setattr(api_main, "ingest_file", fake_ingest_file)
+
+    tasks = BackgroundTasks()
+    upload = UploadFile(file=io.BytesIO(content), filename="Guia Rapido.txt")
+    body = asyncio.run(upload_document(tasks, upload))
+
+    assert body["status"] == "accepted"
+    assert asyncio.run(ingest_status(body["job_id"]))["status"] == "queued"
+
+    asyncio.run(tasks())
+
+    assert asyncio.run(ingest_status(body["job_id"]))["status"] == "success"
+    assert Path(calls["path"]).name.startswith("guia-rapido__v")
+    assert calls["checksum"] == compute_checksum(calls["path"])
+    with open(calls["path"], "rb") as f:
+        assert f.read() == content
+
+
+def test_job_eviction_keeps_queued_jobs(monkeypatch):
+    monkeypatch.setattr(api_main, "_jobs", {})
+    monkeypatch.setattr(api_main, "_MAX_JOBS", 2)
+    monkeypatch.setattr(api_main, "ingest_directory", lambda root, force=False: {"root": root})
+
+    queued = api_main._new_job("batch")
+    finished = api_main._new_job("batch")
+    finished["finished_at"] = "2026-01-01T00:00:00"
+    api_main._new_job("batch")
+    api_main._new_job("batch")
+
+    assert queued["job_id"] in api_main._jobs and finished["job_id"] not in api_main._jobs
+    api_main._run_ingest("/raw", queued)
+    assert asyncio.run(ingest_status(queued["job_id"]))["status"] == "success"
+
+
+def test_ask_reuses_cached_answer_for_repeated_question(monkeypatch):
+    calls = {"generate": 0}
+
+    class FakeRAG:
+        def generate(self, query, k, min_score):
+            calls["generate"] += 1
+            return {"question": query, "answer": "resposta", "status": "success"}
+
+    monkeypatch.setattr(api_main, "_get_rag", lambda: FakeRAG())
+    api_main._invalidate_caches()
+
+    first = asyncio.run(api_main.ask(_json_request(b'{"question": "Como emitir NF?"}')))
+    second = asyncio.run(api_main.ask(_json_request(b'{"question": "  como emitir nf? "}')))
+    api_main._invalidate_caches()
+    asyncio.run(api_main.ask(_json_request(b'{"question": "Como emitir NF?"}')))
+
+    assert first.media_type == "application/json"
+    assert first.body == second.body
+    assert calls["generate"] == 2
+
+
+def test_ask_does_not_cache_llm_fallback(monkeypatch):
+    calls = {"generate": 0}
+
+    class FakeRAG:
+        def generate(self, query, k, min_score):
+            calls["generate"] += 1
+            return {"question": query, "answer": "resumo", "status": "success", "llm_fallback": True}
+
+    monkeypatch.setattr(api_main, "_get_rag", lambda: FakeRAG())
+    api_main._invalidate_caches()
+
+    for _ in range(2):
+        asyncio.run(api_main.ask(_json_request(b'{"question": "Como emitir NF?"}')))
+
+    assert calls["generate"] == 2
+
+
+def test_ask_batch_generates_only_uncached_questions_in_one_call(monkeypatch):
+    batches = []
+
+    class FakeRAG:
+        def generate(self, query, k, min_score):
+            return {"question": query, "answer": "resposta", "status": "success"}
+
+        def generate_batch(self, queries, k, min_score):
+            batches.append(list(queries))
+            return [{"question": q, "answer": "resposta", "status": "success"} for q in queries]
+
+    monkeypatch.setattr(api_main, "_get_rag", lambda: FakeRAG())
+    api_main._invalidate_caches()
+    asyncio.run(api_main.ask(_json_request(b'{"question": "Como emitir NF?"}')))
+
+    response = asyncio.run(api_main.ask_batch(
+        _json_request(b'{"questions": ["como emitir nf?", "Como trocar senha?", "Como abrir chamado?"]}')
+    ))
+
+    results = json.loads(response.body)["results"]
+    assert [r["question"] for r in results] == ["Como emitir NF?", "Como trocar senha?", "Como abrir chamado?"]
+    assert batches == [["Como trocar senha?", "Como abrir chamado?"]]
+    api_main._invalidate_caches()
+
+
+def test_ask_rejects_invalid_body():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api_main.ask(_json_request(b'{"question": "oi", "k": "cinco"}')))
+    assert exc.value.status_code == 422
+
+
+def test_ask_batch_rejects_empty_question_list():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api_main.ask_batch(_json_request(b'{"questions": []}')))
+    assert exc.value.status_code == 422
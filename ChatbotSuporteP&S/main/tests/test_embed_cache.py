@@ -0,0 +1,51 @@
+from array import array
+
+from src.rag.embed_cache import CachedEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_only_new_texts_are_embedded_and_cache_persists(tmp_path):
+    db = tmp_path / "embed_cache.db"
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, db, namespace="fake")
+
+    first = emb.embed_documents(["abc", "de", "abc"])
+    second = emb.embed_documents(["de", "fghi"])
+    reopened = CachedEmbeddings(inner, db, namespace="fake").embed_documents(["fghi"])
+
+    assert [list(v) for v in first] == [[3.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert [list(v) for v in second] == [[2.0, 1.0], [4.0, 1.0]]
+    assert [list(v) for v in reopened] == [[4.0, 1.0]]
+    # buffers float32 tipados, sem um PyFloat por elemento
+    assert all(isinstance(v, array) and v.typecode == "f" for v in first + second + reopened)
+    assert inner.calls == [["abc", "de"], ["fghi"]]
+
+
+def test_namespaces_do_not_share_entries(tmp_path):
+    inner = CountingEmbeddings()
+    CachedEmbeddings(inner, tmp_path / "c.db", namespace="a").embed_documents(["x"])
+    CachedEmbeddings(inner, tmp_path / "c.db", namespace="b").embed_documents(["x"])
+
+    assert inner.calls == [["x"], ["x"]]
+
+
+def test_batch_queries_bypass_the_document_cache(tmp_path):
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, tmp_path / "c.db", namespace="fake")
+
+    assert emb.embed_queries(["como emitir nf?", "login"]) == [[15.0, 1.0], [5.0, 1.0]]
+    emb.embed_documents(["login"])
+
+    assert inner.calls == [["como emitir nf?", "login"], ["login"]]
+    assert emb._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1
@@ -1,8 +1,31 @@
+import os
+import threading
 from pathlib import Path
 
+import pytest
 from langchain_core.documents import Document
 
-from src.ingestion import ingest
+from src.ingestion import ingest, loaders
+from src.rag import vectorstore
+
+
+class FakeStore:
+    def __init__(self, metadatas=None):
+        self.metadatas = metadatas or []
+        self.deleted, self.added, self.persists = [], [], 0
+
+    def get(self, where=None):
+        self.gets = getattr(self, "gets", 0) + 1
+        return {"metadatas": [m for m in self.metadatas if where is None or m["doc_id"] == where["doc_id"]]}
+
+    def delete(self, filter=None):
+        self.deleted.append(filter)
+
+    def add_documents(self, docs):
+        self.added.append(list(docs))
+
+    def persist(self):
+        self.persists += 1
 
 
 def test_ingest_file_success(monkeypatch, tmp_path: Path):
@@ -13,19 +36,305 @@ def test_ingest_file_success(monkeypatch, tmp_path: Path):
 
     calls = {"reindex": 0}
 
-    def fake_build_chunks_for_record(record, chunk_size, chunk_overlap):
-        return [Document(page_content="chunk", metadata={})]
+    def fake_iter_chunks_for_record(record, chunk_size, chunk_overlap):
+        yield Document(page_content="chunk", metadata={})
 
-    def fake_reindex(doc_id, chunks):
+    def fake_reindex(doc_id, chunks, source_path=None):
         calls["reindex"] += 1
-        assert doc_id.startswith("sha256:")
-        assert len(chunks) == 1
+        assert source_path == str(fpath)
+        assert doc_id == loaders.compute_checksum(str(fpath))
+        assert len(list(chunks)) == 1
         return 1
 
-    monkeypatch.setattr(ingest, "build_chunks_for_record", fake_build_chunks_for_record)
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: FakeStore())
+    monkeypatch.setattr(ingest, "iter_chunks_for_record", fake_iter_chunks_for_record)
     monkeypatch.setattr(ingest, "_reindex_document_chunks", fake_reindex)
 
     ok = ingest.ingest_file(str(fpath), root=str(root))
 
     assert ok is True
     assert calls["reindex"] == 1
+
+
+def test_ingest_file_skips_unchanged_document(monkeypatch, tmp_path: Path):
+    root = tmp_path / "raw"
+    fpath = root / "processos" / "guia__v2026-02.txt"
+    fpath.parent.mkdir(parents=True)
+    fpath.write_text("conteudo de teste", encoding="utf-8")
+    checksum = "sha256:" + "ab" * 32
+
+    store = FakeStore(metadatas=[{"doc_id": checksum, "source_path": str(fpath), **ingest._index_params()}])
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("documento inalterado não deve ser reprocessado")
+
+    monkeypatch.setattr(ingest, "iter_chunks_for_record", fail)
+
+    assert ingest.ingest_file(str(fpath), root=str(root), checksum=checksum) is True
+    assert store.deleted == [] and store.added == []
+
+
+def test_ingest_file_reindexes_moved_file_changed_params_or_forced(monkeypatch, tmp_path: Path):
+    root = tmp_path / "raw"
+    fpath = root / "processos" / "guia__v2026-02.txt"
+    fpath.parent.mkdir(parents=True)
+    fpath.write_text("conteudo de teste", encoding="utf-8")
+    checksum = "sha256:" + "ab" * 32
+    current = {"doc_id": checksum, "source_path": str(fpath), **ingest._index_params()}
+    reindexed = []
+    monkeypatch.setattr(ingest, "iter_chunks_for_record", lambda rec, **kw: iter([]))
+    monkeypatch.setattr(ingest, "_reindex_document_chunks", lambda doc_id, chunks, source_path=None: reindexed.append(doc_id))
+
+    for metadata, force in [
+        ({**current, "source_path": str(root / "antigo" / "guia__v2026-02.txt")}, False),
+        ({**current, "chunk_size": current["chunk_size"] + 1}, False),
+        (current, True),
+        (current, False),
+    ]:
+        monkeypatch.setattr(ingest, "get_vectorstore", lambda: FakeStore(metadatas=[metadata]))
+        ingest.ingest_file(str(fpath), root=str(root), checksum=checksum, force=force)
+
+    assert reindexed == [checksum] * 3
+
+
+def test_ingest_directory_batches_writes_and_persists_once(monkeypatch, tmp_path: Path):
+    root = tmp_path / "raw"
+    for name in ("guia__v2026-01.txt", "manual__v2026-02.txt"):
+        fpath = root / "processos" / name
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(f"conteudo de {name}", encoding="utf-8")
+
+    store = FakeStore()
+    cache_dir = tmp_path / "extract"
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(cache_dir))
+
+    stats = ingest.ingest_directory(str(root), workers=1)
+
+    assert stats["processed_docs"] == 2
+    assert stats["indexed_chunks"] == 2
+    assert len(store.deleted) == 1
+    assert all(str(root / "processos" / n) in str(store.deleted) for n in ("guia__v2026-01.txt", "manual__v2026-02.txt"))
+    assert len(store.added) == 1
+    assert store.persists == 1
+    # um único get para decidir o que pular, e os parâmetros vão nos chunks
+    assert store.gets == 1
+    assert all(c.metadata["chunk_size"] == ingest.CHUNK_SIZE for c in store.added[0])
+    assert len(list(cache_dir.glob("*.pkl.gz"))) == 2
+
+
+def test_ingest_directory_uses_non_fork_process_pool_from_a_thread(monkeypatch, tmp_path: Path):
+    # os processos do pool importam src.config de novo: o cache vai por env
+    monkeypatch.setenv("EXTRACT_CACHE_DIR", "")
+    root = tmp_path / "raw"
+    for name in ("guia__v2026-01.txt", "manual__v2026-02.txt", "faq__v2026-03.txt"):
+        fpath = root / "processos" / name
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(f"conteudo de {name}", encoding="utf-8")
+    store = FakeStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+
+    stats = {}
+    job = threading.Thread(target=lambda: stats.update(ingest.ingest_directory(str(root), workers=2)))
+    job.start()
+    job.join(timeout=120)
+
+    assert stats["indexed_chunks"] == 3
+    assert sorted(c.page_content for batch in store.added for c in batch) == [
+        f"conteudo de {n}" for n in ("faq__v2026-03.txt", "guia__v2026-01.txt", "manual__v2026-02.txt")
+    ]
+    assert loaders._process_context().get_start_method() != "fork"
+
+
+def test_ingest_directory_indexes_identical_files_once(monkeypatch, tmp_path: Path):
+    root = tmp_path / "raw"
+    for name in ("guia__v2026-01.txt", "copia__v2026-01.txt"):
+        fpath = root / "processos" / name
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text("mesmo conteudo", encoding="utf-8")
+
+    store = FakeStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+
+    stats = ingest.ingest_directory(str(root), workers=1)
+
+    assert stats["processed_docs"] == 1 and stats["skipped_docs"] == 1
+    assert sum(len(batch) for batch in store.added) == stats["indexed_chunks"] == 1
+
+
+def test_extract_cache_skips_loader_on_reingestion(monkeypatch, tmp_path: Path):
+    fpath = tmp_path / "guia__v2026-02.txt"
+    fpath.write_text("conteudo do guia", encoding="utf-8")
+    record = {"doc_id": loaders.compute_checksum(str(fpath)), "source_path": str(fpath), "extension": ".txt"}
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+
+    first = loaders.extract_text_docs_cached(record)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("arquivo em cache não deve ser reextraído")
+
+    monkeypatch.setattr(loaders, "extract_text_docs", fail)
+    second = loaders.extract_text_docs_cached(record)
+
+    assert [d.page_content for d in second] == [d.page_content for d in first] == ["conteudo do guia"]
+
+
+def test_extract_cache_hit_uses_current_path_and_pdf_loader_in_key(monkeypatch, tmp_path: Path):
+    original = tmp_path / "guia__v2026-02.txt"
+    original.write_text("conteudo do guia", encoding="utf-8")
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+    doc_id = loaders.compute_checksum(str(original))
+    loaders.extract_text_docs_cached({"doc_id": doc_id, "source_path": str(original), "extension": ".txt"})
+
+    copia = tmp_path / "copia__v2026-02.txt"
+    docs = loaders.extract_text_docs_cached({"doc_id": doc_id, "source_path": str(copia), "extension": ".txt"})
+
+    assert [d.metadata["source"] for d in docs] == [str(copia)]
+    pdf = {"doc_id": doc_id, "source_path": "guia.pdf", "extension": ".pdf"}
+    monkeypatch.setattr(loaders, "PDF_LOADER", "pypdf")
+    assert loaders._extract_cache_path(pdf).endswith("_pypdf.pkl.gz")
+
+
+def test_extract_cache_evicts_least_recently_used_files(monkeypatch, tmp_path: Path):
+    cache_dir = tmp_path / "extract"
+    cache_dir.mkdir()
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(cache_dir))
+    for i, name in enumerate(("antigo", "medio", "novo")):
+        fpath = cache_dir / f"{name}.pkl.gz"
+        fpath.write_bytes(b"x" * 100)
+        os.utime(fpath, (1000 + i, 1000 + i))
+
+    loaders._evict_extract_cache(250)
+
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["medio.pkl.gz", "novo.pkl.gz"]
+
+
+def test_reindex_consumes_chunk_generator_in_batches(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(ingest, "ADD_BATCH_SIZE", 2)
+
+    chunks = (Document(page_content=f"chunk {i}", metadata={}) for i in range(5))
+
+    assert ingest._reindex_document_chunks("sha256:abc", chunks) == 5
+    assert [len(batch) for batch in store.added] == [2, 2, 1]
+    assert "sha256:abc" in str(store.deleted) and store.persists == 1
+
+
+def test_reindex_removes_stale_chunks_by_source_path(monkeypatch):
+    # chunks antigos (sha256 de outra versão, ou outro CHECKSUM_ALGO) saem
+    # pelo caminho, já que o doc_id novo não casa com o antigo
+    store = FakeStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+
+    chunks = [Document(page_content="chunk", metadata={})]
+    ingest._reindex_document_chunks("blake3:novo", chunks, source_path="/raw/guia.txt")
+
+    assert store.deleted == [{"$or": [
+        {"doc_id": {"$in": ["blake3:novo"]}},
+        {"$and": [{"source_path": {"$in": ["/raw/guia.txt"]}}, {"doc_id": {"$nin": ["blake3:novo"]}}]},
+    ]}]
+
+
+def test_editing_a_file_keeps_content_of_its_identical_copy(monkeypatch, tmp_path: Path):
+    class LengthEmbeddings:
+        def embed_documents(self, texts):
+            return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(vectorstore, "get_embeddings", lambda: LengthEmbeddings())
+    store = vectorstore.SimpleVectorStore(tmp_path / "store", precision="float32")
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", "")
+
+    root = tmp_path / "raw"
+    original, copia = root / "processos" / "guia__v2026-01.txt", root / "processos" / "copia__v2026-01.txt"
+    original.parent.mkdir(parents=True)
+    original.write_text("conteudo antigo", encoding="utf-8")
+    copia.write_text("conteudo antigo", encoding="utf-8")
+    ingest.ingest_directory(str(root), workers=1)
+
+    original.write_text("conteudo novo", encoding="utf-8")
+    ingest.ingest_directory(str(root), workers=1)
+
+    assert sorted(store.get()["documents"]) == ["conteudo antigo", "conteudo novo"]
+    assert ingest.ingest_directory(str(root), workers=1)["processed_docs"] == 0
+
+
+def test_stale_chunk_removal_failure_is_logged_and_aborts(monkeypatch, caplog):
+    class BrokenStore(FakeStore):
+        def delete(self, filter=None):
+            raise OSError("disco cheio")
+
+    store = BrokenStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+
+    with pytest.raises(OSError):
+        ingest._reindex_document_chunks("sha256:abc", [Document(page_content="chunk", metadata={})])
+
+    assert store.added == [] and "Falha ao remover chunks antigos" in caplog.text
+
+
+def test_add_in_batches_builds_next_batch_while_previous_is_added(monkeypatch):
+    monkeypatch.setattr(ingest, "ADD_BATCH_SIZE", 2)
+    next_batch_started = threading.Event()
+    overlapped = []
+
+    class SlowStore(FakeStore):
+        def add_documents(self, docs):
+            # o primeiro lote só termina depois que o gerador começou o segundo
+            if not self.added:
+                overlapped.append(next_batch_started.wait(timeout=5))
+            super().add_documents(docs)
+
+    def chunks():
+        for i in range(4):
+            if i == 2:
+                next_batch_started.set()
+            yield Document(page_content=f"chunk {i}", metadata={})
+
+    store = SlowStore()
+
+    assert ingest._add_in_batches(store, chunks()) == 4
+    assert overlapped == [True]
+    assert [len(batch) for batch in store.added] == [2, 2]
+
+
+def test_concurrent_ingestions_do_not_interleave_store_writes(monkeypatch, tmp_path: Path):
+    root = tmp_path / "raw"
+    paths = []
+    for name in ("guia__v2026-01.txt", "manual__v2026-02.txt"):
+        fpath = root / "processos" / name
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(f"conteudo de {name}", encoding="utf-8")
+        paths.append(str(fpath))
+
+    ops = []
+
+    class SlowStore(FakeStore):
+        def delete(self, filter=None):
+            ops.append("delete")
+            super().delete(filter)
+
+        def add_documents(self, docs):
+            threading.Event().wait(0.05)
+            ops.append("add")
+            super().add_documents(docs)
+
+        def persist(self):
+            ops.append("persist")
+            super().persist()
+
+    store = SlowStore()
+    monkeypatch.setattr(ingest, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(loaders, "EXTRACT_CACHE_DIR", str(tmp_path / "extract"))
+
+    threads = [threading.Thread(target=ingest.ingest_file, args=(p, str(root))) for p in paths]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    # delete, add, persist de cada job, sem intercalar
+    assert ops == ["delete", "add", "persist"] * 2
@@ -1,8 +1,21 @@
+import hashlib
+from concurrent.futures import Future
 from pathlib import Path
 
 import pytest
+from langchain_core.documents import Document
 
-from src.ingestion.loaders import discover_files, parse_path_metadata
+import src.ingestion.loaders as loaders_module
+from src.ingestion.loaders import (
+    _normalize_text,
+    build_document_records,
+    chunk_document,
+    compute_checksum,
+    discover_files,
+    extract_text_docs,
+    iter_document_records,
+    parse_path_metadata,
+)
 
 
 def test_parse_path_metadata_valid_sistemas(tmp_path: Path):
@@ -36,8 +49,10 @@ def test_discover_files_filters_extensions_and_ignored(tmp_path: Path):
     hidden = root / "processos" / ".oculto.txt"
     temp = root / "processos" / "~$temp.docx"
     unsupported = root / "processos" / "nota.md"
+    in_hidden_dir = root / "processos" / ".git" / "doc__v2026-02.txt"
 
-    valid.parent.mkdir(parents=True)
+    in_hidden_dir.parent.mkdir(parents=True)
+    in_hidden_dir.write_text("ignore", encoding="utf-8")
     valid.write_text("ok", encoding="utf-8")
     hidden.write_text("ignore", encoding="utf-8")
     temp.write_text("ignore", encoding="utf-8")
@@ -50,3 +65,162 @@ def test_discover_files_filters_extensions_and_ignored(tmp_path: Path):
     assert str(hidden) not in paths
     assert str(temp) not in paths
     assert str(unsupported) not in paths
+    assert str(in_hidden_dir) not in paths
+
+
+def test_build_document_records_hashes_in_parallel_preserving_order(tmp_path: Path):
+    root = tmp_path / "raw"
+    (root / "processos").mkdir(parents=True)
+    discovered = []
+    for i in range(6):
+        fpath = root / "processos" / f"doc{i}__v2026-02.txt"
+        fpath.write_text(f"conteudo {i}", encoding="utf-8")
+        discovered.append({"source_path": str(fpath), "extension": ".txt", "size_bytes": 10, "modified_at": ""})
+    missing = {"source_path": str(root / "processos" / "sumiu__v2026-02.txt"), "extension": ".txt", "size_bytes": 0, "modified_at": ""}
+
+    val, ign = build_document_records(str(root), discovered[:3] + [missing] + discovered[3:], max_workers=4)
+
+    assert [r["source_path"] for r in val] == [d["source_path"] for d in discovered]
+    assert val[0]["doc_id"] == compute_checksum(discovered[0]["source_path"])
+    assert ign[0]["reason"].startswith("checksum_error")
+
+
+def test_iter_document_records_matches_two_pass_pipeline(tmp_path: Path):
+    root = tmp_path / "raw"
+    for rel in ("processos/doc__v2026-02.txt", "sistemas/erp/manual__v2026-01.pdf", "processos/sem-versao.txt"):
+        fpath = root / rel
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        fpath.write_text(rel, encoding="utf-8")
+
+    streamed = list(iter_document_records(str(root), max_workers=2))
+    val, ign = build_document_records(str(root), discover_files(str(root)))
+
+    assert sorted((r["source_path"], r["doc_id"], r["system"]) for r, _ in streamed if r) == sorted(
+        (r["source_path"], r["doc_id"], r["system"]) for r in val
+    )
+    assert [i for _, i in streamed if i] == ign == [
+        {"source_path": str(root / "processos" / "sem-versao.txt"), "reason": "missing_version_separator"}
+    ]
+
+
+def test_normalize_text_collapses_line_breaks():
+    assert _normalize_text("  titulo\r\n\r\n\rcorpo\n\n\n\nfim\r") == "titulo\ncorpo\nfim"
+
+
+def test_extract_text_docs_normalizes_on_load(tmp_path: Path):
+    fpath = tmp_path / "guia__v2026-02.txt"
+    fpath.write_bytes("  passo 1\r\n\r\n\r\npasso 2\n\n".encode("utf-8"))
+
+    docs = extract_text_docs(str(fpath), ".txt")
+
+    assert [d.page_content for d in docs] == ["passo 1\npasso 2"]
+
+
+def test_chunk_document_windows_respect_size_and_overlap():
+    text = " ".join(f"palavra{i:02d}" for i in range(40))
+    chunks = chunk_document([Document(page_content=text, metadata={"page": 1})], chunk_size=50, chunk_overlap=20)
+
+    assert all(len(c.page_content) <= 50 for c in chunks)
+    assert all(c.metadata == {"page": 1} for c in chunks)
+    assert chunks[0].page_content.startswith("palavra00")
+    assert chunks[-1].page_content.endswith("palavra39")
+    # a última palavra de um chunk reaparece no início do seguinte
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.page_content.split()[-1] in nxt.page_content.split()
+
+
+def test_chunk_document_hard_splits_tokens_longer_than_chunk_size():
+    token = "x" * 1200
+    text = f"inicio {token} fim"
+    chunks = chunk_document([Document(page_content=text, metadata={})], chunk_size=500, chunk_overlap=100)
+
+    assert all(len(c.page_content) <= 500 for c in chunks)
+    assert sum(c.page_content.count("x") for c in chunks) == len(token)
+    assert chunks[0].page_content == "inicio" and chunks[-1].page_content.endswith("fim")
+
+
+@pytest.mark.parametrize("file_digest", [True, False])
+@pytest.mark.parametrize("content", [b"", b"manual de suporte" * 4096, b"manual de suporte" * (400 << 10)])
+def test_compute_checksum_matches_hashlib(tmp_path: Path, monkeypatch, content: bytes, file_digest: bool):
+    fpath = tmp_path / "doc.pdf"
+    fpath.write_bytes(content)
+    if not file_digest:
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+
+    assert compute_checksum(str(fpath), algo="sha256") == f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+@pytest.mark.parametrize("content", [b"manual de suporte" * 4096, b"manual de suporte" * (400 << 10)])
+def test_compute_checksum_blake3(tmp_path: Path, content: bytes):
+    blake3 = pytest.importorskip("blake3")
+    fpath = tmp_path / "doc.pdf"
+    fpath.write_bytes(content)
+
+    assert compute_checksum(str(fpath), algo="blake3") == f"blake3:{blake3.blake3(fpath.read_bytes()).hexdigest()}"
+
+
+def _minimal_pdf(text: str) -> bytes:
+    """PDF de uma página com `text` em Helvetica, montado à mão."""
+    content = f"BT /F1 12 Tf 20 150 Td ({text}) Tj ET"
+    objs = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out, offsets = b"%PDF-1.4\n", []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def test_pdfium_extraction_matches_pypdf_loader(tmp_path: Path, monkeypatch):
+    pytest.importorskip("pypdfium2")
+    fpath = tmp_path / "manual__v2026-02.pdf"
+    fpath.write_bytes(_minimal_pdf("manual de suporte"))
+
+    monkeypatch.setattr(loaders_module, "PDF_LOADER", "pdfium")
+    pdfium_docs = extract_text_docs(str(fpath), ".pdf")
+    monkeypatch.setattr(loaders_module, "PDF_LOADER", "pypdf")
+    pypdf_docs = extract_text_docs(str(fpath), ".pdf")
+
+    assert [d.page_content for d in pdfium_docs] == [d.page_content for d in pypdf_docs]
+    assert [d.metadata for d in pdfium_docs] == [d.metadata for d in pypdf_docs]
+
+
+def test_ingest_records_bounds_in_flight_work_and_never_forks(monkeypatch):
+    submitted, contexts = [], []
+
+    class InlineExecutor:
+        def __init__(self, max_workers, mp_context):
+            contexts.append(mp_context.get_start_method())
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def submit(self, fn, rec):
+            submitted.append(rec["doc_id"])
+            future = Future()
+            future.set_result([rec["doc_id"]])
+            return future
+
+    monkeypatch.setattr(loaders_module, "ProcessPoolExecutor", InlineExecutor)
+    records = [{"doc_id": f"doc{i}"} for i in range(20)]
+
+    results = loaders_module.ingest_records(records, workers=2)
+    first = next(results)
+
+    assert first == (records[0], ["doc0"])
+    assert len(submitted) == 5
+    assert [rec["doc_id"] for rec, _ in results] == [f"doc{i}" for i in range(1, 20)]
+    assert contexts[0] != "fork"
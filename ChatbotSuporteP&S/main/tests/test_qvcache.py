@@ -0,0 +1,24 @@
+from src.rag.qvcache import QueryVectorCache
+
+
+def test_lookup_hits_near_duplicate_query():
+    cache = QueryVectorCache(max_size=4, ttl_seconds=60, threshold=0.05)
+    hits = [("doc-a", 0.9), ("doc-b", 0.8)]
+    cache.put([1.0, 0.0, 0.5], k=2, hits=hits)
+
+    assert cache.lookup([1.0, 0.01, 0.5], k=2) == hits
+    assert cache.lookup([1.0, 0.01, 0.5], k=1) == hits[:1]
+    assert cache.lookup([0.0, 1.0, 0.0], k=2) is None
+    assert cache.lookup([1.0, 0.0, 0.5], k=5) is None
+
+
+def test_clear_and_lru_eviction():
+    cache = QueryVectorCache(max_size=1, ttl_seconds=60, threshold=0.05)
+    cache.put([1.0, 0.0], k=1, hits=[("doc-a", 0.9)])
+    cache.put([0.0, 1.0], k=1, hits=[("doc-b", 0.9)])
+
+    assert cache.lookup([1.0, 0.0], k=1) is None
+    assert cache.lookup([0.0, 1.0], k=1) == [("doc-b", 0.9)]
+
+    cache.clear()
+    assert cache.lookup([0.0, 1.0], k=1) is None
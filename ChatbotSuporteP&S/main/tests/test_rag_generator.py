@@ -1,7 +1,7 @@
 from langchain_core.documents import Document
 
 import src.rag.generator as generator_module
-from src.rag.generator import RAGGenerator
+from src.rag.generator import RAGGenerator, clear_retrieval_caches
 
 
 def test_generate_fallback_when_llm_unavailable(monkeypatch):
@@ -13,8 +13,107 @@ def test_generate_fallback_when_llm_unavailable(monkeypatch):
 
     result = gen.generate("pergunta de teste", k=1, min_score=0.0)
 
-    assert result["status"] == "success"
+    assert result["status"] == "success" and result["llm_fallback"] is True
     assert "LLM" in result["answer"]
     assert "Resumo do contexto" in result["answer"]
     assert "conteudo relevante" in result["answer"]
     assert result["sources"] == ["doc.txt"]
+
+
+def test_retrieve_caches_exact_queries_until_cleared(monkeypatch):
+    calls = {"embed": 0, "search": 0}
+    hits = [(Document(page_content="conteudo", metadata={}), 0.9)]
+
+    class FakeEmbeddings:
+        def embed_query(self, text):
+            calls["embed"] += 1
+            return [1.0, 0.0]
+
+    class FakeStore:
+        def similarity_search_with_score_by_vector(self, q_vec, k):
+            calls["search"] += 1
+            return hits
+
+    monkeypatch.setattr(generator_module, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(generator_module, "get_vectorstore", lambda: FakeStore())
+    clear_retrieval_caches()
+    gen = RAGGenerator()
+
+    assert gen._retrieve("como  emitir nota", k=3) == hits
+    assert gen._retrieve(" como emitir nota ", k=3) == hits
+    assert calls == {"embed": 1, "search": 1}
+
+    clear_retrieval_caches()
+    gen._retrieve("como emitir nota", k=3)
+    assert calls == {"embed": 2, "search": 2}
+    clear_retrieval_caches()
+
+
+def test_retrieval_running_during_invalidation_is_not_cached(monkeypatch):
+    calls = {"search": 0}
+    stale = [(Document(page_content="antes da ingestao", metadata={}), 0.9)]
+    fresh = [(Document(page_content="depois da ingestao", metadata={}), 0.9)]
+
+    class FakeEmbeddings:
+        def embed_query(self, text):
+            return [1.0, 0.0]
+
+    class FakeStore:
+        def similarity_search_with_score_by_vector(self, q_vec, k):
+            calls["search"] += 1
+            if calls["search"] == 1:
+                # Ingestão termina enquanto a primeira busca está em andamento
+                clear_retrieval_caches()
+                return stale
+            return fresh
+
+    monkeypatch.setattr(generator_module, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(generator_module, "get_vectorstore", lambda: FakeStore())
+    clear_retrieval_caches()
+    gen = RAGGenerator()
+
+    assert gen._retrieve("como emitir nota", k=3) == stale
+    assert gen._retrieve("como emitir nota", k=3) == fresh
+    assert gen._retrieve("como emitir nota", k=3) == fresh
+    assert calls["search"] == 2
+    clear_retrieval_caches()
+
+
+def test_generate_batch_embeds_and_searches_once(monkeypatch):
+    calls = {"embed": 0, "search": 0}
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            calls["embed"] += 1
+            return [[1.0, 0.0], [0.0, 1.0]][: len(texts)]
+
+    class FakeStore:
+        def similarity_search_batch_by_vector(self, q_vecs, k):
+            calls["search"] += 1
+            return [[(Document(page_content=f"doc {v}", metadata={}), 0.9)] for v in q_vecs]
+
+    monkeypatch.setattr(generator_module, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(generator_module, "get_vectorstore", lambda: FakeStore())
+    clear_retrieval_caches()
+
+    monkeypatch.setattr(generator_module, "OPENAI_API_KEY", "")
+
+    results = RAGGenerator().generate_batch(["login", "estoque"], k=1)
+
+    assert [r["status"] for r in results] == ["success", "success"]
+    assert [r["context"] for r in results] == ["doc [1.0, 0.0]", "doc [0.0, 1.0]"]
+    assert calls == {"embed": 1, "search": 1}
+    clear_retrieval_caches()
+
+
+def test_build_context_stops_at_first_hit_below_min_score():
+    hits = [
+        (Document(page_content="a", metadata={"source_path": "x.txt"}), 0.9),
+        (Document(page_content="b", metadata={"source_path": "x.txt"}), 0.7),
+        (Document(page_content="c", metadata={"source_path": "y.txt"}), 0.4),
+    ]
+
+    context, sources = RAGGenerator()._build_context(hits, min_score=0.5)
+
+    assert context == "a\n\n---\n\nb"
+    assert sources == ["x.txt"]
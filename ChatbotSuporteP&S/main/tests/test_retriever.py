@@ -0,0 +1,27 @@
+from langchain_core.documents import Document
+
+import src.rag.retriever as retriever_module
+from src.rag.retriever import Retriever
+
+
+class FakeStore:
+    def similarity_search_with_score(self, query, k=5, min_score=None):
+        hits = [
+            (Document(page_content="linha 1\nlinha 2", metadata={"source_path": "a.pdf"}), 0.9),
+            (Document(page_content="outro", metadata={}), 0.5),
+            (Document(page_content="fraco", metadata={"source_path": "c.pdf"}), 0.1),
+        ][:k]
+        return [hit for hit in hits if min_score is None or hit[1] >= min_score]
+
+
+def test_retrieve_context_passes_min_score_and_formats_hits(monkeypatch):
+    monkeypatch.setattr(retriever_module, "get_vectorstore", lambda: FakeStore())
+    retriever = Retriever()
+
+    assert [r["score"] for r in retriever.retrieve("q", k=3, min_score=0.3)] == [0.9, 0.5]
+    assert retriever.retrieve_context("q", k=3, min_score=0.3) == (
+        "[1] Fonte: a.pdf (relevância: 0.90)\nlinha 1 linha 2...\n"
+        "\n"
+        "[2] Fonte: desconhecido (relevância: 0.50)\noutro...\n"
+    )
+    assert retriever.retrieve_context("q", min_score=0.95) == "Nenhum documento relevante encontrado."
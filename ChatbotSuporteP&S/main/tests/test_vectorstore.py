@@ -0,0 +1,368 @@
+import json
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import src.rag.vectorstore as vectorstore_module
+from src.rag.quantization import dequantize_int8, quantize_int8
+from src.rag.vectorstore import BinaryVectorStore, FaissVectorStore, SimpleVectorStore
+
+
+class FakeEmbeddings:
+    VECTORS = {
+        "login": [1.0, 0.1, 0.0, 0.2],
+        "senha": [0.9, 0.3, 0.1, 0.0],
+        "estoque": [0.0, 0.2, 1.0, 0.7],
+    }
+
+    def embed_documents(self, texts):
+        return [self.VECTORS[t] for t in texts]
+
+    def embed_query(self, text):
+        return self.VECTORS[text]
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(vectorstore_module, "get_embeddings", lambda: FakeEmbeddings())
+    vectorstore_module._embed_query_cached.cache_clear()
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_similarity_search_ranks_and_persists(fake_embeddings, tmp_path, precision):
+    vs = SimpleVectorStore(tmp_path, precision=precision)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    vs.persist()
+
+    reloaded = SimpleVectorStore(tmp_path, precision=precision)
+    hits = reloaded.similarity_search_with_score("login", k=2)
+
+    assert [doc.page_content for doc, _ in hits] == ["login", "senha"]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-2)
+    # embeddings ficam fora do JSON, em sidecars .npy mapeados em memória
+    saved = json.loads((tmp_path / SimpleVectorStore.FILENAME).read_text(encoding="utf-8"))
+    assert set(saved["entries"][0]) == {"page_content", "metadata"}
+    assert all(isinstance(column, np.memmap) for column in reloaded._columns.values())
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_batch_search_matches_single_queries(fake_embeddings, tmp_path, precision):
+    vs = SimpleVectorStore(tmp_path, precision=precision)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+
+    batch = vs.similarity_search_batch(["login", "estoque"], k=2)
+    single = [vs.similarity_search_with_score(q, k=2) for q in ("login", "estoque")]
+
+    assert [[d.page_content for d, _ in hits] for hits in batch] == [
+        [d.page_content for d, _ in hits] for hits in single
+    ]
+    assert batch[1][0][1] == pytest.approx(single[1][0][1])
+
+
+def test_float32_search_same_across_backends(fake_embeddings, tmp_path, monkeypatch):
+    vs = SimpleVectorStore(tmp_path, precision="float32")
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    with_faiss = vs.similarity_search_batch(["login", "estoque"], k=5)
+    monkeypatch.setattr(vectorstore_module, "faiss", None)
+    with_simsimd = vs.similarity_search_batch(["login", "estoque"], k=5)
+    monkeypatch.setattr(vectorstore_module, "simsimd", None)
+    with_numba = vs.similarity_search_batch(["login", "estoque"], k=5)
+    monkeypatch.setattr(vectorstore_module, "NUMBA_AVAILABLE", False)
+    numpy_only = vs.similarity_search_batch(["login", "estoque"], k=5)
+
+    for results in zip(with_faiss, with_simsimd, with_numba, numpy_only):
+        expected = results[-1]
+        for hits in results:
+            assert [d.page_content for d, _ in hits] == [d.page_content for d, _ in expected]
+            assert [s for _, s in hits] == pytest.approx([s for _, s in expected], abs=1e-5)
+    assert len(with_faiss[0]) == 3
+
+
+def test_top_k_rows_selects_each_query_in_descending_order():
+    rng = np.random.default_rng(0)
+    scores = rng.standard_normal((4, 50)).astype(np.float32)
+
+    top, idx = vectorstore_module._top_k_rows(scores, 5)
+
+    expected = np.argsort(-scores, axis=1)[:, :5]
+    np.testing.assert_array_equal(idx, expected)
+    np.testing.assert_array_equal(top, np.take_along_axis(scores, expected, axis=1))
+    assert vectorstore_module._top_k_rows(scores, 99)[1].shape == (4, 50)
+
+
+def test_query_embedding_is_cached(monkeypatch, tmp_path):
+    calls = []
+
+    class CountingEmbeddings(FakeEmbeddings):
+        def embed_query(self, text):
+            calls.append(text)
+            return super().embed_query(text)
+
+    emb = CountingEmbeddings()
+    monkeypatch.setattr(vectorstore_module, "get_embeddings", lambda: emb)
+    vectorstore_module._embed_query_cached.cache_clear()
+    vs = SimpleVectorStore(tmp_path)
+    vs.add_documents([Document(page_content="login", metadata={"doc_id": "login"})])
+
+    first = vs.similarity_search_with_score("login", k=1)
+    second = vs.similarity_search_with_score("login", k=1)
+
+    assert calls == ["login"]
+    assert first[0][1] == pytest.approx(second[0][1])
+    vectorstore_module._embed_query_cached.cache_clear()
+
+
+@pytest.mark.parametrize("use_numba", [True, False])
+def test_int8_scores_match_dequantized_vectors(fake_embeddings, tmp_path, monkeypatch, use_numba):
+    monkeypatch.setattr(vectorstore_module, "NUMBA_AVAILABLE", use_numba and vectorstore_module.NUMBA_AVAILABLE)
+    monkeypatch.setattr(SimpleVectorStore, "INT8_BLOCK_ROWS", 2)
+    vs = SimpleVectorStore(tmp_path, precision="int8")
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    queries = np.array([FakeEmbeddings.VECTORS["login"], FakeEmbeddings.VECTORS["estoque"]])
+
+    cols = vs._columns
+    full = dequantize_int8(cols["embedding_int8"], cols["embedding_offset"], cols["embedding_scale"])
+    expected = vectorstore_module._normalize_rows(queries) @ full.T
+
+    np.testing.assert_allclose(vs._scores(queries), expected, rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize("store_cls", [SimpleVectorStore, BinaryVectorStore, FaissVectorStore])
+def test_search_builds_documents_only_for_top_k(fake_embeddings, tmp_path, monkeypatch, store_cls):
+    vs = store_cls(tmp_path)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    built = []
+
+    class CountingDocument(Document):
+        def __init__(self, **kwargs):
+            built.append(kwargs["page_content"])
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(vectorstore_module, "Document", CountingDocument)
+    hits = vs.similarity_search_with_score("login", k=1)
+
+    assert [d.page_content for d, _ in hits] == built == ["login"]
+
+
+@pytest.mark.parametrize("store_cls", [SimpleVectorStore, FaissVectorStore])
+def test_persist_writes_only_when_dirty(fake_embeddings, tmp_path, monkeypatch, store_cls):
+    vs = store_cls(tmp_path)
+    saves = []
+    original_save = vs._save
+    monkeypatch.setattr(vs, "_save", lambda: (saves.append(1), original_save()))
+
+    vs.persist()
+    vs.add_documents([Document(page_content="login", metadata={"doc_id": "login"})])
+    vs.add_documents([Document(page_content="senha", metadata={"doc_id": "senha"})])
+    vs.persist()
+    vs.delete(filter={"doc_id": "inexistente"})
+    vs.persist()
+    vs.delete(filter={"doc_id": "login"})
+    vs.persist()
+
+    assert len(saves) == 2
+    reloaded = store_cls(tmp_path)
+    assert reloaded.get()["documents"] == ["senha"]
+    assert reloaded._dirty is False
+
+
+@pytest.mark.parametrize("store_cls", [SimpleVectorStore, FaissVectorStore])
+def test_delete_accepts_chroma_style_compound_filter(fake_embeddings, tmp_path, store_cls):
+    vs = store_cls(tmp_path)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t, "source_path": f"/raw/{t}.txt"})
+        for t in ("login", "senha", "estoque")
+    ])
+
+    vs.delete(filter={"$or": [
+        {"doc_id": {"$in": ["login"]}},
+        {"$and": [{"source_path": {"$in": ["/raw/senha.txt", "/raw/estoque.txt"]}}, {"doc_id": {"$nin": ["estoque"]}}]},
+    ]})
+
+    assert vs.get()["documents"] == ["estoque"]
+
+
+def test_int8_bias_is_reused_until_columns_change(fake_embeddings, tmp_path):
+    vs = SimpleVectorStore(tmp_path, precision="int8")
+    vs.add_documents([Document(page_content="login", metadata={"doc_id": "login"})])
+
+    bias = vs._int8_bias()
+    assert vs._int8_bias() is bias
+    vs.add_documents([Document(page_content="estoque", metadata={"doc_id": "estoque"})])
+    assert vs._int8_bias().shape == (2,)
+    assert [d.page_content for d, _ in vs.similarity_search_with_score("estoque", k=1)] == ["estoque"]
+
+
+@pytest.mark.parametrize("store_cls", [SimpleVectorStore, BinaryVectorStore, FaissVectorStore])
+def test_min_score_is_applied_inside_the_store(fake_embeddings, tmp_path, store_cls):
+    vs = store_cls(tmp_path)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+
+    all_hits = vs.similarity_search_with_score("login", k=3)
+    threshold = (all_hits[1][1] + all_hits[2][1]) / 2
+    hits = vs.similarity_search_with_score("login", k=3, min_score=threshold)
+
+    assert [d.page_content for d, _ in hits] == ["login", "senha"]
+    assert vs.similarity_search_batch(["login"], k=3, min_score=1.01) == [[]]
+
+
+def test_binary_store_reranks_hamming_candidates(fake_embeddings, tmp_path):
+    vs = BinaryVectorStore(tmp_path)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+
+    hits = vs.similarity_search_with_score("senha", k=2)
+
+    assert [doc.page_content for doc, _ in hits] == ["senha", "login"]
+    assert hits[0][1] == pytest.approx(1.0)
+
+
+def test_faiss_store_trains_index_and_deletes(fake_embeddings, tmp_path):
+    pytest.importorskip("faiss")
+    vs = FaissVectorStore(tmp_path, index_factory="IVF2,Flat", train_size=3, nprobe=2)
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    vs.delete(filter={"doc_id": "login"})
+    vs.persist()
+
+    reloaded = FaissVectorStore(tmp_path, index_factory="IVF2,Flat", train_size=3, nprobe=2)
+    hits = reloaded.similarity_search_with_score("login", k=2)
+
+    assert reloaded._trained
+    assert [doc.page_content for doc, _ in hits] == ["senha", "estoque"]
+
+
+def test_faiss_store_save_is_atomic_and_unreadable_files_are_not_overwritten(fake_embeddings, tmp_path, monkeypatch):
+    pytest.importorskip("faiss")
+    vs = FaissVectorStore(tmp_path)
+    vs.add_documents([Document(page_content="login", metadata={"doc_id": "login"})])
+    vs.persist()
+    vs.add_documents([Document(page_content="estoque", metadata={"doc_id": "estoque"})])
+
+    def crash(src, dst):
+        raise OSError("queda simulada")
+
+    with monkeypatch.context() as m, pytest.raises(OSError):
+        m.setattr(vectorstore_module.os, "replace", crash)
+        vs.persist()
+    assert FaissVectorStore(tmp_path).get()["documents"] == ["login"]
+
+    vs.persist()
+    assert sorted(p.name for p in tmp_path.glob("*.index")) == ["faiss.2.index"]
+
+    (tmp_path / FaissVectorStore.FILENAME).write_text("{corrompido", encoding="utf-8")
+    broken = FaissVectorStore(tmp_path)
+    broken.add_documents([Document(page_content="senha", metadata={"doc_id": "senha"})])
+    with pytest.raises(RuntimeError):
+        broken.persist()
+    assert (tmp_path / FaissVectorStore.FILENAME).read_text(encoding="utf-8") == "{corrompido"
+
+
+def test_reload_converts_precision_and_delete_keeps_rows_aligned(fake_embeddings, tmp_path):
+    vs = SimpleVectorStore(tmp_path, precision="float32")
+    vs.add_documents([
+        Document(page_content=t, metadata={"doc_id": t}) for t in ("login", "senha", "estoque")
+    ])
+    vs.persist()
+
+    quantized = SimpleVectorStore(tmp_path, precision="int8")
+    quantized.delete(filter={"doc_id": "login"})
+    hits = quantized.similarity_search_with_score("estoque", k=2)
+
+    assert [doc.page_content for doc, _ in hits] == ["estoque", "senha"]
+    assert quantized.get(where={"doc_id": "login"})["metadatas"] == []
+
+
+def test_interrupted_save_keeps_previous_generation(fake_embeddings, tmp_path, monkeypatch):
+    vs = SimpleVectorStore(tmp_path, precision="float32")
+    vs.add_documents([Document(page_content="login", metadata={"doc_id": "login"})])
+    vs.persist()
+    vs.add_documents([Document(page_content="estoque", metadata={"doc_id": "estoque"})])
+
+    # queda depois dos sidecars novos e antes da troca do JSON
+    def crash(src, dst):
+        raise OSError("queda simulada")
+
+    with monkeypatch.context() as m, pytest.raises(OSError):
+        m.setattr(vectorstore_module.os, "replace", crash)
+        vs.persist()
+
+    reloaded = SimpleVectorStore(tmp_path, precision="float32")
+    assert reloaded.get()["documents"] == ["login"]
+    assert [d.page_content for d, _ in reloaded.similarity_search_with_score("login", k=2)] == ["login"]
+
+
+def test_save_migrates_legacy_sidecars_and_drops_old_generations(fake_embeddings, tmp_path):
+    entries = [{"page_content": "login", "metadata": {"doc_id": "login"}}]
+    (tmp_path / SimpleVectorStore.FILENAME).write_text(json.dumps(entries), encoding="utf-8")
+    np.save(tmp_path / "embedding.npy", np.array([FakeEmbeddings.VECTORS["login"]], dtype=np.float32))
+
+    vs = SimpleVectorStore(tmp_path, precision="float32")
+    for t in ("senha", "estoque"):
+        vs.add_documents([Document(page_content=t, metadata={"doc_id": t})])
+        vs.persist()
+
+    assert sorted(p.name for p in tmp_path.glob("*.npy")) == ["embedding.2.npy"]
+    assert all(isinstance(column, np.memmap) for column in vs._columns.values())
+    assert SimpleVectorStore(tmp_path, precision="float32").get()["documents"] == ["login", "senha", "estoque"]
+
+
+def test_unreadable_store_loads_empty(fake_embeddings, tmp_path):
+    # entradas sem nenhuma coluna de embedding conhecida
+    entries = [{"page_content": "login", "metadata": {"doc_id": "login"}, "embedding_bits": "ff"}]
+    (tmp_path / SimpleVectorStore.FILENAME).write_text(json.dumps(entries), encoding="utf-8")
+
+    vs = SimpleVectorStore(tmp_path, precision="int8")
+
+    assert vs.get()["documents"] == [] and vs._dirty is False
+
+
+def test_int8_store_folds_legacy_norm_column(fake_embeddings, tmp_path):
+    entries = []
+    for t in ("login", "estoque"):
+        codes, offsets, scales = quantize_int8(np.array(FakeEmbeddings.VECTORS[t]) * 3.0)
+        entries.append({
+            "page_content": t,
+            "metadata": {"doc_id": t},
+            "embedding_int8": codes[0].tolist(),
+            "embedding_offset": float(offsets[0]),
+            "embedding_scale": float(scales[0]),
+            "embedding_norm": float(np.linalg.norm(dequantize_int8(codes, offsets, scales))),
+        })
+    (tmp_path / SimpleVectorStore.FILENAME).write_text(json.dumps(entries), encoding="utf-8")
+
+    hits = SimpleVectorStore(tmp_path, precision="int8").similarity_search_with_score("login", k=2)
+
+    assert [doc.page_content for doc, _ in hits] == ["login", "estoque"]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-2)
+
+
+def test_preload_and_concurrent_first_calls_share_one_store(fake_embeddings, tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore_module, "_store_singleton", None)
+    monkeypatch.setattr(vectorstore_module, "CHROMA_PERSIST_DIR", tmp_path)
+    monkeypatch.setattr(vectorstore_module, "VECTORSTORE", "simple")
+    monkeypatch.setattr(vectorstore_module, "EMBEDDING_PRECISION", "float32")
+
+    assert not vectorstore_module.vectorstore_loaded()
+    thread = vectorstore_module.preload_vectorstore()
+    store = vectorstore_module.get_vectorstore()
+    thread.join(timeout=5)
+
+    assert vectorstore_module.vectorstore_loaded()
+    assert vectorstore_module.get_vectorstore() is store
+    assert isinstance(store, SimpleVectorStore)